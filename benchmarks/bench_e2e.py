@@ -0,0 +1,152 @@
+"""end-to-end benchmarks that don't need the real service
+
+usage: python -m benchmarks.bench_e2e [--only pow,decode,render,turn] [--turns 20] [--json results.json]
+
+pow:    every solver backend on real-difficulty challenges
+decode: StreamDecoder on a long deep-think style recording
+render: live markdown rendering of that recording's answer
+turn:   full DeepSeekClient turns (session, pow, completion stream) against the
+        local mock server from benchmarks.mock_server
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import time
+from benchmarks.bench_stream import build_recording, best_of, decoder_decode, chunked
+from benchmarks.mock_server import DEFAULT_TOKEN, MockDeepSeek, MockOptions
+
+SECTIONS = ("pow", "decode", "render", "turn")
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+def summarize(values):
+    """median / p95 / min in ms"""
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return {
+        "median_ms": round(statistics.median(values) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "min_ms": round(min(values) * 1000, 2),
+        "runs": len(values),
+    }
+
+def bench_pow(runs):
+    from src.pow import benchmark_backends
+
+    times = {}
+    for _ in range(runs):
+        for name, (_, seconds) in benchmark_backends().items():
+            times.setdefault(name, []).append(seconds)
+    return {name: summarize(values) for name, values in times.items()}
+
+def bench_decode(data):
+    seconds = best_of(decoder_decode, data)
+    return {"ms": round(seconds * 1000, 2), "mib_per_s": round(len(data) / seconds / 2 ** 20, 1)}
+
+def bench_render(data):
+    from rich.console import Console
+    import src.config as config
+    from src.stream import ANSWER, StreamDecoder
+    from src.display import stream_live
+
+    decoder = StreamDecoder()
+    answer = [text for kind, text in decoder.iter_chunks(chunked(data, 16384)) if kind == ANSWER]
+
+    # render to nowhere, but as if it were a real terminal
+    previous = config._console
+    with open(os.devnull, "w") as devnull:
+        config._console = Console(file=devnull, force_terminal=True, width=100)
+        try:
+            start = time.perf_counter()
+            stream_live(iter(answer))
+            seconds = time.perf_counter() - start
+        finally:
+            config._console = previous
+    return {"ms": round(seconds * 1000, 2), "deltas": len(answer), "us_per_delta": round(seconds / len(answer) * 1e6, 2)}
+
+def bench_turn(turns, options):
+    from src.config import Config
+    from src.client import DeepSeekClient
+    from src.credentials import CredentialManager, Credentials
+
+    with MockDeepSeek(options) as mock:
+        Config.BASE_URL = mock.base_url
+        Config.QUIET = True  # no status lines in the middle of the results
+        client = DeepSeekClient(CredentialManager(Credentials({}, DEFAULT_TOKEN)))
+
+        stats = []
+        for i in range(turns):
+            for _ in client.stream(f"benchmark turn {i}", thinking=bool(options.thinking_chunks)):
+                pass
+            stats.append(client.last_stats)
+
+        first, rest = stats[0], stats[1:] or stats
+        result = {
+            "first_turn_ms": round(first.total * 1000, 2),
+            "session_create_ms": round((first.session_create or 0) * 1000, 2),
+        }
+        for phase in ("pow_wait", "pow_solve", "ttfb", "ttft", "total"):
+            result[phase] = summarize([getattr(s, phase) for s in rest])
+        result["tokens_per_second"] = round(statistics.median(s.tokens_per_second or 0 for s in rest), 1)
+        result["server"] = mock.counts
+        return result
+
+def print_results(results):
+    for section, result in results.items():
+        print(f"\n{section}")
+        for name, value in result.items():
+            if isinstance(value, dict):
+                value = "  ".join(f"{k} {v}" for k, v in value.items())
+            print(f"  {name:<20} {value}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default=",".join(SECTIONS), help="comma separated sections to run")
+    parser.add_argument("--pow-runs", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--answer-chunks", type=int, default=400)
+    parser.add_argument("--thinking-chunks", type=int, default=0)
+    parser.add_argument("--chunk-interval", type=float, default=0.0,
+                        help="seconds between sse events from the mock (0 = measure client overhead only)")
+    parser.add_argument("--difficulty", type=int, default=144000)
+    parser.add_argument("--json", metavar="FILE", help="also write the results here, for tracking regressions")
+    args = parser.parse_args()
+
+    sections = [s.strip() for s in args.only.split(",") if s.strip()]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+
+    results = {}
+    data = build_recording() if {"decode", "render"} & set(sections) else None
+    if "pow" in sections:
+        results["pow"] = bench_pow(args.pow_runs)
+    if "decode" in sections:
+        results["decode"] = bench_decode(data)
+    if "render" in sections:
+        results["render"] = bench_render(data)
+    if "turn" in sections:
+        options = MockOptions(
+            difficulty=args.difficulty,
+            answer_chunks=args.answer_chunks,
+            thinking_chunks=args.thinking_chunks,
+            chunk_interval=args.chunk_interval,
+            seed=1,
+        )
+        results["turn"] = bench_turn(args.turns, options)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
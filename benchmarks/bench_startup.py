@@ -0,0 +1,59 @@
+"""measure how long `import main` takes and fail if it's over budget
+
+usage: python -m benchmarks.bench_startup [--budget-ms 250] [--runs 7]
+
+uses `python -X importtime` in fresh processes, so it measures exactly what a
+single prompt invocation pays before doing any work. also lists the heaviest
+imports so regressions are easy to spot.
+"""
+import sys
+import argparse
+import statistics
+import subprocess
+
+DEFAULT_BUDGET_MS = 250
+
+def import_times(module="main"):
+    """run one fresh interpreter, returns {module: (self_us, cumulative_us)}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--top", type=int, default=10, help="heaviest imports to list")
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.runs)]
+    totals = [run["main"][1] / 1000 for run in runs]
+    median = statistics.median(totals)
+
+    # heaviest cumulative imports from the median-ish run
+    run = sorted(runs, key=lambda r: r["main"][1])[len(runs) // 2]
+    print("heaviest imports (cumulative ms):")
+    for name, (_, cumulative) in sorted(run.items(), key=lambda kv: -kv[1][1])[1:args.top + 1]:
+        print(f"  {cumulative / 1000:7.1f}  {name}")
+
+    for heavy in ("nodriver", "wasmtime", "rich.markdown", "httpx", "fastapi"):
+        if heavy in run:
+            print(f"warning: {heavy} is imported at startup")
+
+    print(f"import main: median {median:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    if median > args.budget_ms:
+        print("over budget!")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""compare the old iter_lines + json.loads parsing with StreamDecoder
+
+usage: python -m benchmarks.bench_stream [recording.sse]
+
+without a recording it builds a long deep-think style response. to record a
+real one, write every chunk of resp.iter_content() to a file.
+"""
+import sys
+import json
+import time
+import random
+from src.stream import StreamDecoder
+
+def build_recording(thinking_chunks=20000, answer_chunks=20000, seed=1):
+    """fake stream in deepseek's patch format: thinking first, then the answer"""
+    rng = random.Random(seed)
+    words = ["the", "model", "is", "thinking", "about", "**this**", "`code`", "naïve", "😀", "\"quoted\"", "\\n"]
+
+    def text():
+        return " ".join(rng.choice(words) for _ in range(rng.randint(1, 4))) + " "
+
+    lines = ['data: {"v": {"response": {"message_id": 2, "status": "WIP"}}}']
+    lines.append("data: " + json.dumps({"p": "response/thinking_content", "v": text()}, ensure_ascii=False, separators=(",", ":")))
+    lines += ["data: " + json.dumps({"v": text()}, ensure_ascii=False, separators=(",", ":")) for _ in range(thinking_chunks)]
+    lines.append("data: " + json.dumps({"p": "response/content", "v": text()}, ensure_ascii=False, separators=(",", ":")))
+    lines += ["data: " + json.dumps({"v": text()}, ensure_ascii=False, separators=(",", ":")) for _ in range(answer_chunks)]
+    lines.append('data: {"p":"response","o":"BATCH","v":[{"p":"status","v":"FINISHED"}]}')
+    return ("\n\n".join(lines) + "\n\n").encode("utf-8")
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def iter_lines(chunks):
+    """same splitting requests' iter_lines does"""
+    pending = None
+    for chunk in chunks:
+        if pending is not None:
+            chunk = pending + chunk
+        lines = chunk.splitlines()
+        pending = lines.pop() if lines and lines[-1] and chunk and lines[-1][-1] == chunk[-1] else None
+        yield from lines
+    if pending is not None:
+        yield pending
+
+def legacy_decode(data):
+    """what chat() did before: 512 byte reads, json.loads every line, string +="""
+    thinking_content = ""
+    main_content = ""
+    for line in iter_lines(chunked(data, 512)):
+        if not line:
+            continue
+        decoded = line.decode("utf-8", errors="ignore")
+        if decoded.startswith("data:"):
+            data_str = decoded[5:].strip()
+            if not data_str or data_str == "{}":
+                continue
+            try:
+                chunk = json.loads(data_str)
+                path = chunk.get("p", "")
+                if "v" in chunk:
+                    v_value = chunk["v"]
+                    if "thinking" in path:
+                        thinking_content += str(v_value) if isinstance(v_value, str) else ""
+                        continue
+                    if isinstance(v_value, str) and v_value:
+                        main_content += v_value
+            except:
+                pass
+    return main_content
+
+def decoder_decode(data):
+    decoder = StreamDecoder()
+    for kind, text in decoder.iter_chunks(chunked(data, 16384)):
+        pass
+    return decoder.main_content
+
+def best_of(fn, data, runs=5):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            data = f.read()
+    else:
+        data = build_recording()
+
+    print(f"recording: {len(data) / 1024:.0f} KiB")
+    legacy = best_of(legacy_decode, data)
+    new = best_of(decoder_decode, data)
+    print(f"legacy iter_lines + json.loads: {legacy * 1000:8.1f} ms")
+    print(f"StreamDecoder:                  {new * 1000:8.1f} ms  ({legacy / new:.1f}x)")
+
+if __name__ == "__main__":
+    main()
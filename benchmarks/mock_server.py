@@ -0,0 +1,376 @@
+"""local stand-in for the deepseek chat api, for benchmarks and offline testing
+
+usage: python -m benchmarks.mock_server [--port 8765] [--chunk-interval 0.02]
+       [--thinking-chunks 50] [--answer-chunks 200] [--error-rate 0.1] [--replay recording.sse]
+
+implements chat_session/create, chat/create_pow_challenge (real DeepSeekHashV1
+challenges, so the bundled solvers have to do the actual work) and a streaming
+chat/completion that checks the pow answer, plus file/upload_file and
+file/fetch_files for attachments. point the client at it with
+Config.BASE_URL = "http://127.0.0.1:8765" and any token from --token.
+"""
+import re
+import hmac
+import json
+import time
+import uuid
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.pow import deepseek_hash_v1
+
+DEFAULT_TOKEN = "mock-token"
+WORDS = ["the", "model", "is", "thinking", "about", "**this**", "`code`", "naïve", "😀", "\"quoted\"", "\n"]
+
+class MockOptions:
+    """how the fake api behaves, every field can be changed while it runs"""
+
+    def __init__(self, token=DEFAULT_TOKEN, difficulty=144000, thinking_chunks=0, answer_chunks=200,
+                 chunk_interval=0.0, first_token_delay=0.0, error_rate=0.0, error_status=429,
+                 drop_rate=0.0, finish_delay=0.0, replay=None, seed=None):
+        self.token = token
+        self.difficulty = difficulty
+        self.thinking_chunks = thinking_chunks  # only sent when the request enables thinking
+        self.answer_chunks = answer_chunks
+        self.chunk_interval = chunk_interval  # seconds between sse events, 0 = as fast as possible
+        self.first_token_delay = first_token_delay  # "model is thinking" pause before the first event
+        self.error_rate = error_rate  # fraction of completions answered with error_status
+        self.error_status = error_status
+        self.drop_rate = drop_rate  # fraction of completions cut off halfway through
+        self.finish_delay = finish_delay  # pause between the FINISHED event and the end of the body
+        self.replay = replay  # raw sse bytes to send instead of generated text
+        self.rng = random.Random(seed)
+
+class MockState:
+    """what the server remembers between requests"""
+
+    def __init__(self, options):
+        self.options = options
+        self.secret = uuid.uuid4().bytes  # signs challenges so we know we issued them
+        self.sessions = set()
+        self.message_ids = {}
+        self.issued = {}  # challenge -> (expire_at, target_path)
+        self.files = {}  # file id -> (name, size)
+        self.lock = threading.Lock()
+        self.counts = {"connections": 0, "sessions": 0, "challenges": 0, "completions": 0, "uploads": 0, "errors": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def sign(self, challenge, salt, expire_at):
+        return hmac.new(self.secret, f"{challenge}:{salt}:{expire_at}".encode(), hashlib.sha256).hexdigest()
+
+    def new_challenge(self, target_path="/api/v0/chat/completion"):
+        """a challenge with a known answer below difficulty, exactly like the real one"""
+        options = self.options
+        with self.lock:
+            answer = options.rng.randrange(options.difficulty)
+            salt = "%016x" % options.rng.getrandbits(64)
+        expire_at = int(time.time() * 1000) + 300000
+        challenge = deepseek_hash_v1(f"{salt}_{expire_at}_{answer}".encode())
+        return {
+            "algorithm": "DeepSeekHashV1",
+            "challenge": challenge,
+            "salt": salt,
+            "difficulty": options.difficulty,
+            "expire_at": expire_at,
+            "signature": self.sign(challenge, salt, expire_at),
+            "target_path": target_path,
+        }
+
+    def issue(self, target_path="/api/v0/chat/completion"):
+        """new challenge, remembered until it's used (the client doesn't echo expire_at back)"""
+        challenge = self.new_challenge(target_path)
+        now = time.time() * 1000
+        with self.lock:
+            self.issued = {c: issued for c, issued in self.issued.items() if issued[0] > now}
+            self.issued[challenge["challenge"]] = (challenge["expire_at"], target_path)
+        return challenge
+
+    def check_pow(self, header, path="/api/v0/chat/completion"):
+        """None if the x-ds-pow-response header is a valid answer, else why not"""
+        try:
+            answer = json.loads(base64.b64decode(header))
+            challenge, salt, signature = answer["challenge"], answer["salt"], answer["signature"]
+        except Exception:
+            return "malformed pow response"
+        with self.lock:
+            issued = self.issued.pop(challenge, None)  # every challenge works once
+        if issued is None:
+            return "unknown or reused challenge"
+        expire_at, target_path = issued
+        if target_path != path:
+            return f"challenge is for {target_path}"
+        if not hmac.compare_digest(signature, self.sign(challenge, salt, expire_at)):
+            return "bad signature"
+        if expire_at < time.time() * 1000:
+            return "challenge expired"
+        if deepseek_hash_v1(f"{salt}_{expire_at}_{answer.get('answer')}".encode()) != challenge:
+            return "wrong answer"
+        return None
+
+    def next_message_id(self, session_id, parent_id):
+        with self.lock:
+            message_id = max(self.message_ids.get(session_id, 0), parent_id or 0) + 2
+            self.message_ids[session_id] = message_id
+            return message_id
+
+def sse_events(options, message_id, thinking):
+    """deepseek's patch format: response header, thinking, answer, then FINISHED"""
+    rng = options.rng
+
+    def text():
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))) + " "
+
+    def event(data):
+        return b"data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode() + b"\n\n"
+
+    yield event({"v": {"response": {"message_id": message_id, "parent_id": message_id - 1, "status": "WIP"}}})
+    if thinking and options.thinking_chunks:
+        yield event({"p": "response/thinking_content", "v": text()})
+        for _ in range(options.thinking_chunks - 1):
+            yield event({"v": text()})
+    yield event({"p": "response/content", "o": "APPEND", "v": text()})
+    for _ in range(options.answer_chunks - 1):
+        yield event({"v": text()})
+    yield event({"p": "response", "o": "BATCH", "v": [{"p": "status", "v": "FINISHED"}]})
+
+def replay_events(data):
+    """split a recording back into its sse events"""
+    for part in data.split(b"\n\n"):
+        if part.strip():
+            yield part + b"\n\n"
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real api
+    state = None  # set by MockDeepSeek
+
+    def setup(self):
+        super().setup()
+        self.state.count("connections")  # one handler per tcp connection, so this shows keep-alive reuse
+
+    def log_message(self, *args):
+        pass  # benchmarks don't want a line per request
+
+    def _send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _ok(self, biz_data):
+        self._send_json({"code": 0, "msg": "", "data": {"biz_code": 0, "biz_msg": "", "biz_data": biz_data}})
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+
+    def _authorized(self):
+        if self.headers.get("authorization") == f"Bearer {self.state.options.token}":
+            return True
+        self._send_json({"code": 40003, "msg": "Authorization Failed (invalid token)", "data": None}, status=401)
+        return False
+
+    def do_GET(self):
+        if self.path == "/api/v0/users/current":
+            if self._authorized():
+                self._ok({"id": "mock-user", "email": "mock@example.com"})
+            return
+        if self.path.startswith("/api/v0/file/fetch_files"):
+            if self._authorized():
+                ids = parse_qs(urlparse(self.path).query).get("file_ids", [""])[0].split(",")
+                with self.state.lock:
+                    files = [{"id": i, "status": "SUCCESS", "file_name": self.state.files[i][0]}
+                             for i in ids if i in self.state.files]
+                self._ok({"files": files})
+            return
+        self._send_json({"code": 404, "msg": "not found"}, status=404)
+
+    def do_POST(self):
+        if self.path == "/api/v0/file/upload_file":
+            self._upload()
+            return
+        body = self._read_body()
+        if not self._authorized():
+            return
+        if self.path == "/api/v0/chat_session/create":
+            self.state.count("sessions")
+            session_id = str(uuid.uuid4())
+            with self.state.lock:
+                self.state.sessions.add(session_id)
+            self._ok({"id": session_id, "agent": body.get("agent", "chat")})
+        elif self.path == "/api/v0/chat/create_pow_challenge":
+            self.state.count("challenges")
+            challenge = self.state.issue(body.get("target_path", "/api/v0/chat/completion"))
+            self._ok({"challenge": challenge})
+        elif self.path == "/api/v0/chat/completion":
+            self._completion(body)
+        else:
+            self._send_json({"code": 404, "msg": "not found"}, status=404)
+
+    def _upload(self):
+        """multipart upload, read in pieces so big files don't sit in memory here either"""
+        length = int(self.headers.get("Content-Length") or 0)
+        head = self.rfile.read(min(length, 4096))
+        remaining = length - len(head)
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(remaining, 1 << 20)))
+        if not self._authorized():
+            return
+        problem = self.state.check_pow(self.headers.get("x-ds-pow-response", ""), self.path)
+        if problem:
+            self._send_json({"code": 40301, "msg": f"Invalid PoW: {problem}"}, status=422)
+            return
+        name = re.search(rb'filename="([^"]*)"', head)
+        file_id = f"file-{uuid.uuid4()}"
+        with self.state.lock:
+            self.state.files[file_id] = (name.group(1).decode() if name else "file", length)
+        self.state.count("uploads")
+        self._ok({"id": file_id, "status": "PENDING"})
+
+    def _completion(self, body):
+        state, options = self.state, self.state.options
+        state.count("completions")
+
+        problem = state.check_pow(self.headers.get("x-ds-pow-response", ""))
+        if problem:
+            self._send_json({"code": 40301, "msg": f"Invalid PoW: {problem}"}, status=422)
+            return
+        if body.get("chat_session_id") not in state.sessions:
+            self._send_json({"code": 40400, "msg": "Session not found"}, status=404)
+            return
+        unknown = [i for i in body.get("ref_file_ids") or [] if i not in state.files]
+        if unknown:
+            self._send_json({"code": 40400, "msg": f"File not found: {unknown[0]}"}, status=400)
+            return
+
+        if options.error_rate and options.rng.random() < options.error_rate:
+            state.count("errors")
+            self._send_json({"code": options.error_status, "msg": "injected error"}, status=options.error_status,
+                            headers={"Retry-After": "1"} if options.error_status == 429 else None)
+            return
+
+        message_id = state.next_message_id(body["chat_session_id"], body.get("parent_message_id"))
+        if options.replay is not None:
+            events = list(replay_events(options.replay))
+        else:
+            events = list(sse_events(options, message_id, body.get("thinking_enabled")))
+        dropped = bool(options.drop_rate) and options.rng.random() < options.drop_rate
+        if dropped:
+            state.count("errors")
+            events = events[:len(events) // 2]
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        if options.first_token_delay:
+            time.sleep(options.first_token_delay)
+        if options.chunk_interval:
+            for event in events:
+                self._write_chunk(event)
+                time.sleep(options.chunk_interval)
+        else:
+            self._write_chunk(b"".join(events))
+
+        if dropped:
+            self.close_connection = True  # connection dies mid answer, no end of body
+            return
+        if options.finish_delay:
+            time.sleep(options.finish_delay)
+        self._write_chunk(b"")  # end of chunked body
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+class MockDeepSeek:
+    """the mock server in a background thread: `with MockDeepSeek(options) as mock: mock.base_url`"""
+
+    def __init__(self, options=None, host="127.0.0.1", port=0):
+        self.options = options or MockOptions()
+        self.state = MockState(self.options)
+        handler = type("BoundMockHandler", (MockHandler,), {"state": self.state})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def counts(self):
+        return dict(self.state.counts)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-deepseek", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token", default=DEFAULT_TOKEN)
+    parser.add_argument("--difficulty", type=int, default=144000)
+    parser.add_argument("--thinking-chunks", type=int, default=50)
+    parser.add_argument("--answer-chunks", type=int, default=200)
+    parser.add_argument("--chunk-interval", type=float, default=0.02, help="seconds between sse events")
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--finish-delay", type=float, default=0.0, help="seconds between FINISHED and the end of the body")
+    parser.add_argument("--replay", metavar="FILE", help="send this recorded sse stream for every completion")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    replay = None
+    if args.replay:
+        with open(args.replay, "rb") as f:
+            replay = f.read()
+
+    options = MockOptions(
+        token=args.token, difficulty=args.difficulty, thinking_chunks=args.thinking_chunks,
+        answer_chunks=args.answer_chunks, chunk_interval=args.chunk_interval,
+        first_token_delay=args.first_token_delay, error_rate=args.error_rate,
+        error_status=args.error_status, drop_rate=args.drop_rate,
+        finish_delay=args.finish_delay, replay=replay, seed=args.seed,
+    )
+    mock = MockDeepSeek(options, args.host, args.port)
+    print(f"mock deepseek api on {mock.base_url} (token {args.token!r}), ctrl-c to stop")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.server.server_close()
+
+if __name__ == "__main__":
+    main()
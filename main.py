@@ -1,52 +1,91 @@
+import os
 import sys
-import asyncio
-from src.config import Config
-from src.auth import AuthExtractor
+import json
+import time
+import argparse
+from src.config import Config, get_console
+from src.metrics import record_auth, exporter_for
 from src.client import DeepSeekClient
-from src.display import get_user_input, print_goodbye
-from rich.console import Console
+from src.sessions import SessionPool
+from src.display import get_user_input, print_event, print_goodbye
 
-console = Console()
-
-async def ensure_auth():
-    """make sure we're logged in and ready to go"""
-    if Config.needs_reauth():
-        Config.print_status("Session expired, logging in...", "yellow")
-        
-        if not Config.DEEPSEEK_EMAIL or not Config.DEEPSEEK_PASSWORD:
-            Config.print_status("No email/password in .env file!", "red")
-            return False
-        
-        extractor = AuthExtractor()
-        cookies, token = await extractor.extract_credentials()
-        
-        if not cookies or not token:
-            Config.print_status("Login failed!", "red")
-            return False
-        
-        Config.print_status("Login successful!", "green")
-    else:
+def check_auth():
+    """fast path when the session is still good, asyncio and the browser only load for a real login"""
+    started = time.perf_counter()
+    if not Config.needs_reauth():
+        record_auth(time.perf_counter() - started)
         Config.print_status("Using existing session", "green")
+        return True
     
-    return True
+    import asyncio
+    from src.auth import ensure_auth
+    
+    return asyncio.run(ensure_auth())
+
+def open_store():
+    """the transcript database, or None if recording is turned off"""
+    if not Config.CONVERSATIONS_DB:
+        return None
+    from src.store import ConversationStore
+    return ConversationStore()
+
+def open_cache():
+    """the response cache for --cache"""
+    from src.cache import ResponseCache
+    return ResponseCache()
+
+def open_uploads():
+    """index of files already uploaded, or None if it's turned off"""
+    if not Config.UPLOADS_DB:
+        return None
+    from src.uploads import UploadIndex
+    return UploadIndex()
+
+def make_client(resume=None, cache=False, metrics_out=None):
+    """client that records to the store, continuing a stored conversation if asked (-1 = latest)"""
+    client = DeepSeekClient()
+    client.store = open_store()
+    client.uploads = open_uploads()
+    if cache:
+        client.cache = open_cache()
+    if metrics_out:
+        client.metrics = exporter_for(metrics_out)
+    if resume is not None:
+        if not client.resume(None if resume < 0 else resume):
+            Config.print_status("No conversation to resume", "red")
+            sys.exit(1)
+        Config.print_status(f"Resuming conversation {client.conversation_id}", "green")
+    return client
 
-def interactive_mode():
+def print_stats(stats):
+    """--stats line after a turn"""
+    if stats is not None:
+        get_console().print(f"[dim]{stats.summary()}[/dim]", highlight=False)
+
+def interactive_mode(resume=None, stats=False, metrics_out=None):
     """run in interactive chat mode"""
     # make sure we're logged in first
-    if not asyncio.run(ensure_auth()):
+    if not check_auth():
         sys.exit(1)
     
-    client = DeepSeekClient()
+    client = make_client(resume, metrics_out=metrics_out)
+    client.credentials.start_background_refresh()  # chats can go on for hours
+    client.session_pool = SessionPool()
+    client.fill_sessions()  # ready before the first message (and every /new) needs one
+    console = get_console()
     
     console.print("\n[bold cyan]Interactive Chat Mode[/bold cyan]")
-    console.print("[dim]Commands: /think, /search, /exit[/dim]\n")
+    console.print("[dim]Commands: /think, /search, /file PATH, /new, /exit[/dim]\n")
     
     # track current settings
     thinking = False
     search = False
+    attachments = []  # sent with the next message
     
     while True:
         try:
+            # solve the next challenge while the user is still typing
+            client.prefetch_pow()
             prompt = get_user_input()
             
             if not prompt:
@@ -64,9 +103,29 @@ def interactive_mode():
                 search = not search
                 console.print(f"[yellow]Web search: {'ON' if search else 'OFF'}[/yellow]")
                 continue
+            elif prompt.strip().lower().startswith('/file '):
+                path = os.path.expanduser(prompt.strip()[len('/file '):].strip())
+                if os.path.isfile(path):
+                    attachments.append(path)
+                    console.print(f"[yellow]Attached {os.path.basename(path)} (sent with your next message)[/yellow]")
+                else:
+                    console.print(f"[red]No such file: {path}[/red]")
+                continue
+            elif prompt.strip().lower() == '/new':
+                client = client.conversation()
+                console.print("[yellow]New conversation[/yellow]")
+                continue
             
-            # send message with current settings
-            client.chat(prompt, thinking=thinking, search=search)
+            # send message with current settings, ctrl-c cancels just this message
+            try:
+                reply = client.chat(prompt, thinking=thinking, search=search, files=attachments)
+            except KeyboardInterrupt:
+                console.print("\n[yellow]Cancelled[/yellow]")
+                continue
+            if reply is not None:
+                attachments = []
+            if stats and reply is not None:
+                print_stats(reply.stats)
             
             
         except KeyboardInterrupt:
@@ -75,22 +134,189 @@ def interactive_mode():
         except Exception as e:
             console.print(f"[red]Error: {e}[/red]")
 
-def single_prompt_mode(prompt):
+def single_prompt_mode(prompt, thinking=False, search=False, resume=None, cache=False, stats=False, metrics_out=None,
+                       files=None):
     """run a single prompt and exit"""
-    if not asyncio.run(ensure_auth()):
+    if not check_auth():
         sys.exit(1)
     
-    client = DeepSeekClient()
-    client.chat(prompt)
+    client = make_client(resume, cache, metrics_out)
+    client.keep_alive = False  # one turn and we exit, don't wait for the end of the body
+    reply = client.chat(prompt, thinking=thinking, search=search, files=files)
+    if stats and reply is not None:
+        print_stats(reply.stats)
+
+def raw_prompt_mode(prompt, output="raw", thinking=False, search=False, resume=None, cache=False,
+                    stats=False, metrics_out=None, files=None):
+    """stream straight to stdout for pipes, no rich at all"""
+    Config.QUIET = True
+    if not check_auth():
+        sys.exit(1)
+    
+    client = make_client(resume, cache, metrics_out)
+    client.keep_alive = False  # one turn and we exit, don't wait for the end of the body
+    out = sys.stdout
+    
+    try:
+        for event in client.events(prompt, thinking=thinking, search=search, files=files):
+            if event.kind == "status" or event.kind == "error":
+                print_event(event)  # stderr, Config.QUIET is on
+                if event.kind == "error":
+                    sys.exit(1)
+                continue
+            if event.kind == "answer" or (event.kind == "thinking" and output == "jsonl"):
+                if output == "jsonl":
+                    out.write(json.dumps({"type": event.kind, "text": event.text}, ensure_ascii=False) + "\n")
+                else:
+                    out.write(event.text)
+                out.flush()
+        
+        if output == "jsonl":
+            done = {"type": "done", "message_id": client.parent_message_id}
+            if stats:
+                done["stats"] = client.last_stats.as_dict()
+            out.write(json.dumps(done) + "\n")
+        else:
+            out.write("\n")
+        out.flush()
+        if stats and output != "jsonl":
+            sys.stderr.write(client.last_stats.summary() + "\n")  # stdout is the answer
+    except RuntimeError as e:
+        # api failures arrive as error events, this is something local (e.g. no pow backend)
+        Config.print_status(str(e), "red")  # stderr, Config.QUIET is on
+        sys.exit(1)
+    except BrokenPipeError:
+        # reader went away (e.g. `| head`), don't print a traceback
+        sys.stdout = None
+        sys.exit(0)
+
+def history_mode(query=None):
+    """list recent conversations, or search every transcript"""
+    import datetime
+    
+    store = open_store()
+    if store is None:
+        Config.print_status("Conversation history is turned off (Config.CONVERSATIONS_DB)", "red")
+        sys.exit(1)
+    
+    console = get_console()
+    rows = store.search(query) if query else store.recent()
+    if not rows:
+        console.print("[dim]Nothing found[/dim]")
+        return
+    
+    for row in rows:
+        if query:
+            when = datetime.datetime.fromtimestamp(row["created"]).strftime("%Y-%m-%d %H:%M")
+            console.print(f"[cyan]{row['conversation_id']:>5}[/cyan]  [dim]{when}[/dim]  {row['title']}")
+            console.print(f"       {row['snippet']}", markup=False, highlight=False)
+        else:
+            when = datetime.datetime.fromtimestamp(row["updated"]).strftime("%Y-%m-%d %H:%M")
+            console.print(f"[cyan]{row['id']:>5}[/cyan]  [dim]{when}  {row['turns']} turns[/dim]  {row['title']}")
+    console.print("[dim]Continue one with --resume ID[/dim]")
+
+def batch_mode(input_path, output_path, concurrency=None, cache=False, metrics_out=None):
+    """run a jsonl file of prompts, results go to another jsonl"""
+    import asyncio
+    from src.batch import run_batch
+    
+    if not check_auth():
+        sys.exit(1)
+    
+    response_cache = open_cache() if cache else None
+    metrics = exporter_for(metrics_out) if metrics_out else None
+    sessions = SessionPool()
+    ok, failed = asyncio.run(run_batch(input_path, output_path, concurrency, response_cache, metrics, sessions,
+                                       open_uploads()))
+    Config.print_status(f"Batch finished: {ok} done, {failed} failed", "green" if not failed else "yellow")
+    pool = sessions.stats()
+    Config.print_status(f"Session pool: {pool['hits']} hits, {pool['misses']} misses", "cyan")
+    if response_cache is not None:
+        stats = response_cache.stats()
+        Config.print_status(f"Cache: {stats['hits']} hits, {stats['misses']} misses ({stats['entries']} entries)", "cyan")
+    if failed:
+        sys.exit(1)
+
+def serve_mode(host=None, port=None, metrics_out=None):
+    """keep one warm process around that speaks the openai api"""
+    from src.server import serve
+    
+    if not check_auth():
+        sys.exit(1)
+    
+    serve(host, port, metrics_out)
+
+def conversation_id(value):
+    """--resume takes an id from --history or "last" (-1)"""
+    if value == "last":
+        return -1
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected a conversation ID or 'last'")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DeepSeek reverse client")
+    parser.add_argument("prompt", nargs="*", help="prompt to send (interactive mode if empty)")
+    parser.add_argument("--think", action="store_true", help="enable deep thinking")
+    parser.add_argument("--search", action="store_true", help="enable web search")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--raw", action="store_const", dest="output", const="raw",
+                        help="write the answer as plain text to stdout")
+    output.add_argument("--jsonl", action="store_const", dest="output", const="jsonl",
+                        help="write one json event per line to stdout")
+    parser.add_argument("--file", action="append", dest="files", metavar="PATH",
+                        help="attach a file to the prompt (repeatable, unchanged files aren't uploaded twice)")
+    parser.add_argument("--resume", type=conversation_id, metavar="ID",
+                        help="continue a stored conversation, by ID or 'last'")
+    parser.add_argument("--history", action="store_true", help="list recent conversations")
+    parser.add_argument("--find", metavar="QUERY", help="search every stored transcript")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse cached answers for identical one-off prompts (not in interactive mode)")
+    parser.add_argument("--stats", action="store_true", help="show where each turn spent its time")
+    parser.add_argument("--metrics-out", metavar="FILE",
+                        help="append per-turn timings as jsonl (or keep a prometheus textfile if FILE ends in .prom)")
+    parser.add_argument("--batch", metavar="FILE", help="run every prompt in a jsonl file")
+    parser.add_argument("--out", metavar="FILE", help="where batch results go (default: FILE.out.jsonl)")
+    parser.add_argument("--concurrency", type=int, help=f"prompts in flight at once (default {Config.BATCH_CONCURRENCY})")
+    parser.add_argument("--serve", action="store_true", help="run an OpenAI-compatible server on localhost")
+    parser.add_argument("--host", help=f"server host (default {Config.SERVER_HOST})")
+    parser.add_argument("--port", type=int, help=f"server port (default {Config.SERVER_PORT})")
+    return parser.parse_args(argv)
 
 def main():
-    if len(sys.argv) < 2:
+    args = parse_args()
+    if args.serve:
+        serve_mode(args.host, args.port, args.metrics_out)
+        return
+    
+    if args.batch:
+        output_path = args.out or args.batch.rsplit(".", 1)[0] + ".out.jsonl"
+        batch_mode(args.batch, output_path, args.concurrency, args.cache, args.metrics_out)
+        return
+    
+    if args.history or args.find:
+        history_mode(args.find)
+        return
+    
+    if not args.prompt:
         # no args = interactive mode
-        interactive_mode()
+        interactive_mode(args.resume, args.stats, args.metrics_out)
+        return
+    
+    # has args = single prompt mode
+    prompt = " ".join(args.prompt)
+    for path in args.files or ():
+        if not os.path.isfile(path):
+            Config.print_status(f"No such file: {path}", "red")
+            sys.exit(1)
+    if args.output:
+        raw_prompt_mode(prompt, args.output, thinking=args.think, search=args.search,
+                        resume=args.resume, cache=args.cache, stats=args.stats, metrics_out=args.metrics_out,
+                        files=args.files)
     else:
-        # has args = single prompt mode
-        prompt = " ".join(sys.argv[1:])
-        single_prompt_mode(prompt)
+        single_prompt_mode(prompt, thinking=args.think, search=args.search, resume=args.resume,
+                           cache=args.cache, stats=args.stats, metrics_out=args.metrics_out, files=args.files)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,346 @@
+import os
+import time
+import asyncio
+import httpx
+from .config import Config
+from .client import BaseClient, DeepSeekError, is_json, parse_retry_after
+from .events import DELTAS, Error, Finish, MessageId
+from .metrics import Reply, TurnStats
+from .stream import ANSWER, StreamDecoder
+from .uploads import MultipartFile
+
+def create_http_client():
+    """one pooled connection for every endpoint, share it between clients to run many chats at once"""
+    limits = httpx.Limits(
+        max_connections=Config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.HTTP_MAX_CONNECTIONS,
+    )
+    return httpx.AsyncClient(
+        base_url=Config.BASE_URL,
+        http2=Config.HTTP2,
+        limits=limits,
+        timeout=httpx.Timeout(Config.HTTP_TIMEOUT),  # the completion stream sets its own read timeout
+    )
+
+_background = set()  # drain and session pool tasks, the loop only keeps weak references to them
+
+async def drain_response(resp, chunks, timeout):
+    """read the rest of a finished stream so its connection can be reused, giving up after timeout"""
+    async def exhaust():
+        async for _ in chunks:
+            pass
+
+    try:
+        await asyncio.wait_for(exhaust(), timeout)
+    except Exception:
+        pass  # too slow or broken, aclose() drops the connection instead
+    finally:
+        await resp.aclose()
+
+class AsyncDeepSeekClient(BaseClient):
+    """asyncio version of DeepSeekClient, no console output, just streams text"""
+
+    def __init__(self, http=None, credentials=None):
+        super().__init__(credentials)
+        self._owns_http = http is None
+        self.http = http or create_http_client()
+        self._refills = set()  # timers replacing pooled sessions once they expire, aclose() cancels them
+
+    def _new_handle(self):
+        handle = AsyncDeepSeekClient(self.http, self.credentials)  # doesn't own the pool, aclose() leaves it open
+        handle._refills = self._refills
+        return handle
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        """close the connection pool (only if we made it)"""
+        if self._owns_http:
+            for timer in self._refills.copy():
+                timer.cancel()
+            await self.http.aclose()
+
+    async def _create_session(self):
+        """make a new chat session (or take a ready one from the pool) or reuse existing one"""
+        if self.session_id:
+            return self.session_id
+
+        session_id = None
+        if self.session_pool is not None:
+            session_id = self.session_pool.take()
+            self.fill_sessions()  # replace it before the next conversation needs one
+        # no transport.acall() here, this is part of a completion attempt that's retried as a whole
+        self.session_id = session_id or await self._request_session()
+        return self.session_id
+
+    async def _send(self, method, path, pow_header=None, headers=None, stream=False, **kwargs):
+        """one http request with the current auth, a network failure becomes a DeepSeekError without status"""
+        if stream:
+            # the model can think for a while between events, but a dead connection still ends
+            kwargs["timeout"] = httpx.Timeout(Config.HTTP_TIMEOUT, read=Config.STREAM_IDLE_TIMEOUT)
+        request = self.http.build_request(
+            method,
+            path,
+            headers={**self._headers(pow_header), **(headers or {})},
+            **kwargs
+        )
+        try:
+            return await self.http.send(request, stream=stream)
+        except httpx.TransportError as e:
+            raise DeepSeekError(f"Network error: {str(e) or type(e).__name__}") from e
+
+    async def _api(self, method, path, what, **kwargs):
+        """a json api request through the transport, returns the parsed response"""
+        async def send():
+            return self._read_json(await self._send(method, path, **kwargs), what)
+
+        return await self.transport.acall(send)
+
+    async def _request_session(self):
+        """chat_session/create, one try, returns the new id"""
+        resp = await self._send("POST", "/api/v0/chat_session/create", json={"agent": "chat"})
+        return self._read_json(resp, "Creating session")["data"]["biz_data"]["id"]
+
+    def fill_sessions(self):
+        """top the session pool up in the background (needs a running event loop)"""
+        if self.session_pool is None or not self.token:
+            return
+        for _ in range(self.session_pool.reserve()):
+            task = asyncio.ensure_future(self._pool_session())
+            _background.add(task)
+            task.add_done_callback(_background.discard)
+
+    async def _pool_session(self):
+        session_id = None
+        try:
+            session_id = await self.transport.acall(self._request_session)
+        except Exception:
+            pass  # the pool just stays a session short, the next take() tries again
+        finally:
+            self.session_pool.add(session_id)
+        if session_id:
+            self._refill_at_expiry()
+
+    def _refill_at_expiry(self):
+        """DeepSeekClient._refill_at_expiry on the event loop"""
+        def refill():
+            self._refills.discard(timer)
+            self.fill_sessions()
+
+        timer = asyncio.get_running_loop().call_later(self.session_pool.max_age, refill)
+        self._refills.add(timer)
+
+    async def _fetch_pow(self, target_path="/api/v0/chat/completion"):
+        """get the challenge and solve it off the event loop, returns (header, expire_at, (fetch, solve seconds))
+
+        one try, part of the request it's for (see DeepSeekClient._fetch_pow)
+        """
+        started = time.perf_counter()
+        resp = await self._send("POST", "/api/v0/chat/create_pow_challenge", json={"target_path": target_path})
+        data = self._read_json(resp, "PoW challenge")
+        fetched = time.perf_counter()
+        pow_header, expire_at = await self._solve_challenge_async(data)
+        if not pow_header:
+            raise DeepSeekError("Failed to solve PoW")
+        return pow_header, expire_at, (fetched - started, time.perf_counter() - fetched)
+
+    async def _get_pow_challenge(self):
+        return (await self._fetch_pow())[0]
+
+    def prefetch_pow(self):
+        """start solving the next challenge in the background (not while the circuit breaker is open)"""
+        if self.token and self._prefetched_pow is None and self.transport.breaker.closed:
+            self._prefetched_pow = asyncio.ensure_future(self._fetch_pow())
+
+    async def _take_pow(self, stats):
+        """use the prefetched answer if it's still valid, otherwise solve a fresh one"""
+        task, self._prefetched_pow = self._prefetched_pow, None
+        with stats.span("pow_wait"):
+            if task is not None:
+                try:
+                    pow_header, expire_at, timings = await task
+                    if self._pow_still_valid(expire_at):
+                        stats.set_pow(timings)
+                        return pow_header
+                except Exception:
+                    pass
+            pow_header, _, timings = await self._fetch_pow()
+            stats.set_pow(timings)
+            return pow_header
+
+    async def upload_file(self, file_path):
+        """async version of DeepSeekClient.upload_file, hashing and disk reads stay off the loop where it matters"""
+        digest = None
+        if self.uploads is not None:
+            digest = await asyncio.get_running_loop().run_in_executor(None, self.uploads.digest, file_path)
+            file_id = self.uploads.get(digest)
+            if file_id:
+                return file_id
+
+        body = MultipartFile(file_path)
+
+        async def send():
+            pow_header = (await self._fetch_pow("/api/v0/file/upload_file"))[0]
+            resp = await self._send(
+                "POST",
+                "/api/v0/file/upload_file",
+                pow_header,
+                # known length, so no chunked encoding
+                headers={"Content-Type": body.content_type, "Content-Length": str(len(body))},
+                content=body.aiter(),
+            )
+            return self._read_json(resp, "Upload")["data"]["biz_data"]["id"]
+
+        file_id = await self.transport.acall(send)
+
+        deadline = time.monotonic() + Config.UPLOAD_TIMEOUT
+        while True:
+            data = await self._api("GET", "/api/v0/file/fetch_files", "Checking upload", params={"file_ids": file_id})
+            if self._file_ready(data, file_id):
+                break
+            if time.monotonic() > deadline:
+                raise DeepSeekError(f"Upload {file_id} still processing after {Config.UPLOAD_TIMEOUT}s")
+            await asyncio.sleep(Config.UPLOAD_POLL_INTERVAL)
+
+        if digest is not None:
+            self.uploads.put(digest, file_id, os.path.basename(file_path), body.size)
+        return file_id
+
+    async def _timed_session(self, stats):
+        if self.session_id:
+            return self.session_id
+        with stats.span("session_create"):
+            return await self._create_session()
+
+    async def stream(self, prompt, thinking=False, search=False, files=None):
+        """send a message and yield (kind, text) deltas, kind is "thinking" or "answer"
+
+        files are paths to attach. raises DeepSeekError when the api refuses something,
+        OSError when an attached file can't be read
+        """
+        stats = self.last_stats = TurnStats()
+        file_ids = [await self.upload_file(path) for path in files or ()]
+        key = self._cache_key(prompt, thinking, search, file_ids)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                stats.cached = True
+                for delta in stats.watch(cached, self._record_stats):
+                    yield delta
+                return
+
+        decoder = StreamDecoder()
+        deltas = self._request(prompt, thinking, search, stats, file_ids, decoder)
+        if key is not None:
+            deltas = self.cache.arecord(key, deltas, decoder)
+        async for delta in stats.awatch(deltas, self._record_stats):
+            yield delta
+
+    async def _open(self, prompt, thinking, search, stats, file_ids):
+        """one try at everything before the first token, a retry reuses the session but solves a fresh challenge"""
+        # session and challenge don't depend on each other
+        session_id, pow_header = await asyncio.gather(self._timed_session(stats), self._take_pow(stats))
+        resp = await self._send(
+            "POST",
+            "/api/v0/chat/completion",
+            pow_header,
+            json=self._completion_payload(session_id, prompt, thinking, search, file_ids),
+            stream=True,
+        )
+        stats.mark("ttfb")
+        if is_json(resp):
+            # a refusal (bad pow, expired token, rate limit) can come back as a 200 with a json body
+            try:
+                await resp.aread()
+                self._read_json(resp, "Request")
+            finally:
+                await resp.aclose()
+            raise DeepSeekError("Request failed: got JSON instead of an answer stream", status=resp.status_code)
+        if resp.status_code != 200:
+            self._check_auth(resp)
+            await resp.aclose()
+            raise DeepSeekError(
+                f"Request failed: {resp.status_code}",
+                status=resp.status_code,
+                retry_after=parse_retry_after(resp.headers.get("Retry-After")),
+            )
+        return resp
+
+    async def _request(self, prompt, thinking, search, stats, file_ids=(), decoder=None):
+        """the real round trip behind stream()"""
+        with stats.span("credentials"):
+            token = self.token
+        if not token:
+            raise DeepSeekError("No auth token found", status=401)
+
+        resp = await self.transport.acall(lambda: self._open(prompt, thinking, search, stats, file_ids))
+        decoder = decoder or StreamDecoder()
+        chunks = resp.aiter_bytes()
+        try:
+            turn = self._start_turn(prompt)
+            try:
+                async for data in chunks:
+                    for delta in decoder.feed(data):
+                        if turn is not None:
+                            turn.add(*delta)
+                        yield delta
+                    if decoder.finished:
+                        break  # don't wait for the server to end the body
+                else:
+                    for delta in decoder.close():
+                        if turn is not None:
+                            turn.add(*delta)
+                        yield delta
+            except httpx.TransportError as e:
+                raise DeepSeekError(f"Connection lost mid answer: {str(e) or type(e).__name__}") from e
+            finally:
+                if turn is not None:
+                    turn.finish(decoder.response_message_id, decoder.finished)
+        finally:
+            if decoder.finished and self.keep_alive:
+                # only the end of the body is left, read it in the background so the connection goes back to the pool
+                task = asyncio.ensure_future(drain_response(resp, chunks, Config.STREAM_DRAIN_TIMEOUT))
+                _background.add(task)
+                task.add_done_callback(_background.discard)
+            else:
+                await resp.aclose()  # cut off mid answer or failed, the connection can't be reused
+
+        if decoder.response_message_id:
+            self.parent_message_id = decoder.response_message_id
+
+    async def events(self, prompt, thinking=False, search=False, files=None):
+        """async version of DeepSeekClient.events(): Thinking/Answer, MessageId, Finish or Error
+
+        no Status events, session and pow run concurrently here and nothing is shown to a user
+        """
+        parent_message_id = self.parent_message_id
+        deltas = self.stream(prompt, thinking=thinking, search=search, files=files)
+        try:
+            async for kind, text in deltas:
+                yield DELTAS[kind](text)
+        except DeepSeekError as e:
+            yield Error(str(e), e.status, e.code, e.retry_after)
+            return
+        finally:
+            await deltas.aclose()
+
+        if self.parent_message_id != parent_message_id:
+            yield MessageId(self.parent_message_id)
+        yield Finish(self.last_stats)
+
+    async def chat_stream(self, prompt, thinking=False, search=False, files=None):
+        """send a message and yield the answer text as it streams in"""
+        async for kind, text in self.stream(prompt, thinking=thinking, search=search, files=files):
+            if kind == ANSWER:
+                yield text
+
+    async def chat(self, prompt, thinking=False, search=False, files=None):
+        """send a message and return the whole answer (a Reply, timings on .stats)"""
+        parts = []
+        async for text in self.chat_stream(prompt, thinking=thinking, search=search, files=files):
+            parts.append(text)
+        return Reply("".join(parts), self.last_stats)
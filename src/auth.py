@@ -1,129 +1,134 @@
+import os
+import time
 import asyncio
-import nodriver as uc
 import json
 from .config import Config
+from .credentials import Credentials, probe_credentials
+
+# long lived browser (Config.BROWSER_KEEP_ALIVE) and the event loop it belongs to
+_browser = None
+_browser_loop = None
+
+EMAIL_SELECTORS = ['input[placeholder*="email"]', 'input[type="email"]', 'input[name="email"]']
+
+# best guess first, the generic ones are a last resort
+LOGIN_BUTTON_SELECTORS = [
+    'div[role="button"].ds-sign-up-form__register-button',
+    'button[type="submit"]',
+    'div[role="button"]',
+    '.login-button',
+    '.sign-in-button',
+    'button',
+    '[role="button"]',
+]
+
+# tags the first matching button so we can grab it, returns the selector index or -1
+FIND_LOGIN_BUTTON_JS = """
+(() => {
+    const selectors = %s;
+    for (let i = 0; i < selectors.length; i++) {
+        const el = document.querySelector(selectors[i]);
+        if (el) {
+            el.setAttribute("data-ds-login-button", "");
+            return i;
+        }
+    }
+    return -1;
+})()
+"""
+
+CLEAR_TOKEN_JS = 'localStorage.removeItem("userToken")'
+
+READ_TOKEN_JS = """
+(() => {
+    try {
+        const raw = localStorage.getItem("userToken");
+        return raw ? JSON.parse(raw).value || null : null;
+    } catch (e) {
+        return null;
+    }
+})()
+"""
 
 class AuthExtractor:
     def __init__(self):
         self.config = Config()
+        Config.load_env()
     
     async def extract_credentials(self):
         """login and grab our cookies and token"""
+        # nodriver takes ages to import, only pay for it when we really log in
+        import nodriver as uc
         
-        self.config.print_status("Starting browser (this might take a sec)...", "yellow")
-        browser = await uc.start(headless=self.config.HEADLESS)
+        browser = await self._start_browser(uc)
         
         try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.config.AUTH_DEADLINE
+            
+            def remaining():
+                left = deadline - loop.time()
+                if left <= 0:
+                    raise Exception(f"Login took longer than {self.config.AUTH_DEADLINE}s")
+                return left
+            
             page = await browser.get(f"{self.config.BASE_URL}/")
             
-            self.config.print_status("Waiting for page to load...", "cyan")
-            await page.sleep(5)
+            # a warm profile usually still has a good session, then a reload is all it takes
+            if self.config.BROWSER_PROFILE_DIR:
+                reused = await self._reuse_session(uc, page)
+                if reused:
+                    return reused
+                # stored session is gone, forget its token so we only pick up the new one
+                await page.evaluate(CLEAR_TOKEN_JS)
+                page = await browser.get(f"{self.config.BASE_URL}/")
             
-            self.config.print_status("Filling in login details...", "cyan")
-            # try multiple selectors for email input
-            email_input = None
-            for selector in ['input[placeholder*="email"]', 'input[type="email"]', 'input[name="email"]']:
-                try:
-                    email_input = await page.find(selector, timeout=3)
-                    break
-                except:
-                    continue
-            
-            if not email_input:
+            # notice the login api answering instead of guessing how long it takes
+            login_seen = asyncio.Event()
+            
+            def on_response(event):
+                if self.config.LOGIN_API_PATH in event.response.url and event.response.status == 200:
+                    login_seen.set()
+            
+            page.add_handler(uc.cdp.network.ResponseReceived, on_response)
+            await page.send(uc.cdp.network.enable())
+            
+            self.config.print_status("Waiting for login form...", "cyan")
+            # the form showing up is the "page loaded" signal, no fixed sleep
+            # (select() returns None when it times out, it doesn't raise)
+            email_input = await page.select(", ".join(EMAIL_SELECTORS), timeout=remaining())
+            if email_input is None:
                 raise Exception("Could not find email input field")
             
+            self.config.print_status("Filling in login details...", "cyan")
             await email_input.send_keys(self.config.DEEPSEEK_EMAIL)
-            await page.sleep(1)
             
-            password_input = await page.find('input[type="password"]', timeout=10)
+            password_input = await page.select('input[type="password"]', timeout=remaining())
+            if password_input is None:
+                raise Exception("Could not find password input field")
             await password_input.send_keys(self.config.DEEPSEEK_PASSWORD)
-            await page.sleep(1)
-            
-            self.config.print_status("Looking for login button...", "cyan")
-            # try multiple selectors for login button
-            login_btn = None
-            selectors = [
-                'div[role="button"].ds-sign-up-form__register-button',
-                'button[type="submit"]',
-                'div[role="button"]',
-                'button:contains("Sign in")',
-                'button:contains("Login")',
-                '.login-button',
-                '.sign-in-button',
-                'button',
-                '[role="button"]'
-            ]
-            
-            for selector in selectors:
-                try:
-                    login_btn = await page.find(selector, timeout=2)
-                    self.config.print_status(f"Found login button with selector: {selector}", "green")
-                    break
-                except:
-                    self.config.print_status(f"Selector {selector} not found", "yellow")
-                    continue
-            
-            if not login_btn:
-                # try to find any clickable element that might be the login button
-                self.config.print_status("Trying to find any button elements...", "yellow")
-                try:
-                    all_buttons = await page.find_all('button')
-                    self.config.print_status(f"Found {len(all_buttons)} button elements", "cyan")
-                    
-                    all_divs = await page.find_all('div[role="button"]')
-                    self.config.print_status(f"Found {len(all_divs)} div[role=button] elements", "cyan")
-                    
-                    # try the first button we find
-                    if all_buttons:
-                        login_btn = all_buttons[0]
-                        self.config.print_status("Using first button found", "yellow")
-                    elif all_divs:
-                        login_btn = all_divs[0]
-                        self.config.print_status("Using first div[role=button] found", "yellow")
-                except Exception as e:
-                    self.config.print_status(f"Error finding buttons: {e}", "red")
-            
-            if not login_btn:
+            
+            # pick the best login button in one dom query instead of trying selectors one by one
+            index = await page.evaluate(FIND_LOGIN_BUTTON_JS % json.dumps(LOGIN_BUTTON_SELECTORS), return_by_value=True)
+            if not isinstance(index, int) or index < 0:
                 raise Exception("Could not find any login button")
+            self.config.print_status(f"Found login button with selector: {LOGIN_BUTTON_SELECTORS[index]}", "green")
+            login_btn = await page.select("[data-ds-login-button]", timeout=remaining())
+            if login_btn is None:
+                raise Exception("Could not find the login button we marked")
             
             self.config.print_status("Clicking login button...", "cyan")
             await login_btn.click()
             
-            self.config.print_status(f"Waiting {self.config.AUTH_WAIT_TIME} seconds for login...", "yellow")
-            await page.sleep(self.config.AUTH_WAIT_TIME)
+            self.config.print_status("Waiting for login...", "yellow")
+            token = await self._wait_for_token(page, login_seen, remaining)
             
             # get cookies from browser
             self.config.print_status("Grabbing cookies...", "cyan")
-            cookies_raw = await page.send(uc.cdp.network.get_cookies())
-            
-            cookie_dict = {}
-            for cookie in cookies_raw:
-                cookie_dict[cookie.name] = cookie.value
-            
-            # get auth token from browser storage
-            self.config.print_status("Getting auth token...", "cyan")
-            try:
-                token = await page.evaluate('JSON.parse(localStorage.getItem("userToken")).value')
-                
-                if token:
-                    self.config.print_status(f"Got token: {token[:20]}...", "green")
-                    
-                    with open(self.config.TOKEN_FILE, "w") as f:
-                        f.write(token)
-                else:
-                    self.config.print_status("Couldn't find token", "red")
-                    token = None
-            except Exception as e:
-                self.config.print_status(f"Token extraction failed: {e}", "red")
-                token = None
-            
-            # save cookies to file
-            with open(self.config.COOKIES_FILE, "w") as f:
-                json.dump(cookie_dict, f, indent=2)
-            
-            # remember when we logged in
-            self.config.update_login_time()
+            cookie_dict = await _cookies_from_page(uc, page)
             
+            # saving is up to the caller (the credential store), so half a login never hits disk
+            self.config.print_status(f"Got token: {token[:20]}...", "green")
             self.config.print_status(f"Success! Got {len(cookie_dict)} cookies", "green")
             
             # check if we got the important stuff
@@ -137,26 +142,136 @@ class AuthExtractor:
             
         except Exception as e:
             self.config.print_status(f"Login failed: {e}", "red")
+            if self.config.BROWSER_KEEP_ALIVE:
+                await close_browser()  # don't keep a browser around in a weird state
             return None, None
         
         finally:
-            # close browser quietly
-            if browser:
-                try:
-                    await browser.stop()
-                except:
-                    pass  # ignore cleanup errors
+            if not self.config.BROWSER_KEEP_ALIVE:
+                await _stop(browser)
+    
+    async def _start_browser(self, uc):
+        """a fresh browser, or the one we kept running if it's still usable"""
+        global _browser, _browser_loop
+        loop = asyncio.get_running_loop()
+        if self.config.BROWSER_KEEP_ALIVE and _browser is not None:
+            # the devtools connection only works on the loop that opened it
+            if _browser_loop is loop and not getattr(_browser, "stopped", False):
+                self.config.print_status("Reusing running browser...", "yellow")
+                return _browser
+            await close_browser()
+        
+        options = {"headless": self.config.HEADLESS}
+        if self.config.BROWSER_PROFILE_DIR:
+            options["user_data_dir"] = os.path.abspath(self.config.BROWSER_PROFILE_DIR)
+        
+        self.config.print_status("Starting browser (this might take a sec)...", "yellow")
+        browser = await uc.start(**options)
+        if self.config.BROWSER_KEEP_ALIVE:
+            _browser, _browser_loop = browser, loop
+        return browser
+    
+    async def _reuse_session(self, uc, page):
+        """token + cookies from the profile if the api still takes them, else None"""
+        token = await _token_from_page(page)
+        if not token:
+            return None
+        
+        cookies = await _cookies_from_page(uc, page)
+        loop = asyncio.get_running_loop()
+        # None means we couldn't reach the api, the browser session is as good a bet as any
+        valid = await loop.run_in_executor(None, probe_credentials, Credentials(cookies, token))
+        if valid is False:
+            self.config.print_status("Stored browser session expired", "yellow")
+            return None
+        
+        self.config.print_status("Reused browser session, no password needed", "green")
+        return cookies, token
+    
+    async def _wait_for_token(self, page, login_seen, remaining):
+        """poll localStorage for the token, waking up early once the login api answered"""
+        while True:
+            token = await _token_from_page(page)
+            if token:
+                return token
+            
+            if login_seen.is_set():
+                # api said yes, the page is just about to store the token
+                await asyncio.sleep(min(0.05, remaining()))
+                continue
+            
+            try:
+                await asyncio.wait_for(login_seen.wait(), timeout=min(self.config.AUTH_POLL_INTERVAL, remaining()))
+            except asyncio.TimeoutError:
+                pass
+
+async def _token_from_page(page):
+    token = await page.evaluate(READ_TOKEN_JS, return_by_value=True)
+    return token if isinstance(token, str) and token else None
+
+async def _cookies_from_page(uc, page):
+    cookies = await page.send(uc.cdp.network.get_cookies())
+    return {cookie.name: cookie.value for cookie in cookies}
+
+async def _stop(browser):
+    """close a browser quietly, stop() is sync in some nodriver versions and async in others"""
+    if not browser:
+        return
+    try:
+        result = browser.stop()
+        if asyncio.iscoroutine(result):
+            await result
+    except Exception:
+        pass  # ignore cleanup errors
+
+async def close_browser():
+    """shut down the kept-alive browser, if there is one"""
+    global _browser, _browser_loop
+    browser, _browser, _browser_loop = _browser, None, None
+    await _stop(browser)
+
+async def ensure_auth():
+    """make sure we're logged in and ready to go (the time it takes is charged to the next turn's stats)"""
+    from .metrics import record_auth
+    
+    started = time.perf_counter()
+    try:
+        return await _ensure_auth()
+    finally:
+        record_auth(time.perf_counter() - started)
+
+async def _ensure_auth():
+    if Config.needs_reauth():
+        Config.print_status("Session expired, logging in...", "yellow")
+        Config.load_env()
+        
+        if not Config.DEEPSEEK_EMAIL or not Config.DEEPSEEK_PASSWORD:
+            Config.print_status("No email/password in .env file!", "red")
+            return False
+        
+        # goes through the shared manager so every client picks up the new login
+        from .credentials import get_credentials
+        
+        if not await get_credentials().refresh_async():
+            Config.print_status("Login failed!", "red")
+            return False
+        
+        Config.print_status("Login successful!", "green")
+    else:
+        Config.print_status("Using existing session", "green")
+    
+    return True
 
 async def main():
     """test the auth stuff"""
+    Config.load_env()
     if not Config.DEEPSEEK_EMAIL or not Config.DEEPSEEK_PASSWORD:
         Config.print_status("No email/password in .env file!", "red")
         return
     
-    extractor = AuthExtractor()
-    cookies, token = await extractor.extract_credentials()
+    from .credentials import get_credentials
     
-    if cookies and token:
+    if await get_credentials().refresh_async():
         Config.print_status("Authentication successful!", "green")
     else:
         Config.print_status("Authentication failed!", "red")
@@ -0,0 +1,186 @@
+import json
+import time
+import asyncio
+import httpx
+from .config import Config
+from .async_client import AsyncDeepSeekClient
+from .transport import CircuitOpenError, DeepSeekError, backoff_delay
+from .stream import ANSWER
+
+def parse_item(line):
+    """one jsonl line as an item, or {"error": ...} saying why it can't be run"""
+    try:
+        item = json.loads(line)
+    except ValueError as e:
+        return {"error": f"not valid JSON: {e}"}
+    if isinstance(item, str):
+        return {"prompt": item}
+    if not isinstance(item, dict):
+        return {"error": "expected a JSON object or string"}
+    if not isinstance(item.get("prompt"), str):
+        return {"id": item.get("id"), "error": 'missing "prompt" string'}
+    if not isinstance(item.get("files") or [], list):
+        return {"id": item.get("id"), "error": '"files" must be a list of paths'}
+    return item
+
+def load_items(path):
+    """read prompts from jsonl, each line {"prompt": ..., "thinking": bool, "search": bool, "files": [paths], "id": optional}
+
+    lines that can't be run come back with an "error" instead of a prompt
+    """
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = parse_item(line)
+            if item.get("id") is None:
+                item["id"] = line_no  # line number keeps resume working without ids
+            items.append(item)
+    return items
+
+def load_done(path):
+    """ids that already have a successful result in the output file"""
+    done = set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # half-written line from a killed run
+                if "error" not in record:
+                    done.add(record.get("id"))
+    except FileNotFoundError:
+        pass
+    return done
+
+async def run_item(client, item):
+    """run one prompt in its own fresh conversation on client, retrying what's worth retrying"""
+    attempt = 0
+    while True:
+        # every attempt gets its own session and parent chain
+        conversation = client.conversation()
+        started = time.perf_counter()
+        answer, thinking = [], []
+
+        try:
+            async for kind, text in conversation.stream(
+                item["prompt"],
+                thinking=bool(item.get("thinking")),
+                search=bool(item.get("search")),
+                files=item.get("files"),
+            ):
+                (answer if kind == ANSWER else thinking).append(text)
+
+            return {
+                "id": item["id"],
+                "answer": "".join(answer),
+                "thinking": "".join(thinking),
+                "message_id": conversation.parent_message_id,
+                "session_id": conversation.session_id,
+                "attempts": attempt + 1,
+                "seconds": round(time.perf_counter() - started, 3),
+                "stats": conversation.last_stats.as_dict(),
+            }
+        except (DeepSeekError, httpx.HTTPError, OSError) as e:
+            # OSError: an attached file is missing or unreadable, no point retrying
+            retryable = isinstance(e, httpx.HTTPError) or (isinstance(e, DeepSeekError) and e.retryable)
+            if not retryable or attempt >= Config.BATCH_MAX_RETRIES:
+                return {"id": item["id"], "error": str(e), "attempts": attempt + 1}
+            # a whole item again is a retry like any other, except waiting out an open
+            # circuit breaker, which sends nothing
+            if not isinstance(e, CircuitOpenError) and not client.transport.budget.withdraw():
+                return {"id": item["id"], "error": f"{e} (retry budget used up)", "attempts": attempt + 1}
+
+            delay = backoff_delay(attempt, getattr(e, "retry_after", None),
+                                  Config.BATCH_BACKOFF_BASE, Config.BATCH_BACKOFF_MAX)
+            Config.print_status(f"Item {item['id']}: {e}, retrying in {delay:.1f}s", "yellow")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+async def upload_attachments(client, items, concurrency):
+    """upload every distinct attached file once, up front, so items sharing a document find it in the index"""
+    paths = {path for item in items for path in item.get("files") or ()}
+    limit = asyncio.Semaphore(concurrency)
+
+    async def upload(path):
+        async with limit:
+            try:
+                await client.upload_file(path)
+            except (DeepSeekError, httpx.HTTPError, OSError) as e:
+                # the items attaching it try again (and report the error) themselves
+                Config.print_status(f"Uploading {path} failed: {e}", "yellow")
+
+    await asyncio.gather(*(upload(path) for path in sorted(paths)))
+
+async def run_batch(input_path, output_path, concurrency=None, cache=None, metrics=None, sessions=None, uploads=None):
+    """run every prompt not already in output_path, at most `concurrency` at a time
+
+    results are appended in completion order, so the output file is also the
+    checkpoint: run it again and only missing or failed items are retried
+    """
+    concurrency = concurrency or Config.BATCH_CONCURRENCY
+    items = load_items(input_path)
+    done = load_done(output_path)
+    queue = asyncio.Queue()
+    invalid = []
+    for item in items:
+        if item["id"] in done:
+            continue
+        if "error" in item:
+            invalid.append(item)
+        else:
+            queue.put_nowait(item)
+
+    if invalid:
+        with open(output_path, "a", encoding="utf-8") as out:
+            for item in invalid:
+                Config.print_status(f"Item {item['id']}: {item['error']}, skipped", "red")
+                out.write(json.dumps({"id": item["id"], "error": item["error"], "attempts": 0}, ensure_ascii=False) + "\n")
+
+    total = queue.qsize()
+    Config.print_status(f"{total} of {len(items)} prompts to run ({concurrency} at a time)", "cyan")
+    if not total:
+        return 0, len(invalid)
+
+    counts = {"ok": 0, "failed": 0}
+
+    # one client for the pool, credentials, cache and metrics, a conversation per item
+    client = AsyncDeepSeekClient()
+    client.credentials.start_background_refresh()  # long batches outlive a login
+    client.cache = cache  # identical prompts across items skip the api entirely
+    client.metrics = metrics
+    client.session_pool = sessions  # items start on a ready session instead of creating one
+    client.fill_sessions()
+    client.uploads = uploads
+    if uploads is not None:
+        await upload_attachments(client, [item for item in items if item["id"] not in done], concurrency)
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        async def worker():
+            while not queue.empty():
+                item = queue.get_nowait()
+                try:
+                    record = await run_item(client, item)
+                except Exception as e:
+                    # a bug hit by one item shouldn't take the ones still running down with it
+                    record = {"id": item["id"], "error": f"{type(e).__name__}: {e}", "attempts": 1}
+                counts["failed" if "error" in record else "ok"] += 1
+
+                # one line per result, flushed so a crash loses nothing finished
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                Config.print_status(
+                    f"[{counts['ok'] + counts['failed']}/{total}] item {item['id']} "
+                    + ("failed: " + record["error"] if "error" in record else "done"),
+                    "red" if "error" in record else "green",
+                )
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+        finally:
+            await client.aclose()
+
+    return counts["ok"], counts["failed"] + len(invalid)
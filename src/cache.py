@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from .config import Config
+from .stream import THINKING, ANSWER
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_by_last_used ON responses(last_used);
+"""
+
+# deltas are stored as [kind, text] with the kind squeezed into one digit
+_KINDS = {THINKING: 0, ANSWER: 1}
+_KIND_NAMES = {code: kind for kind, code in _KINDS.items()}
+
+class ResponseCache:
+    """finished answers for stateless prompts, so repeats skip session, pow and generation
+
+    entries are the zlib compressed deltas of the original stream, replayed as-is
+    on a hit. every entry has its own expiry, and once the file holds more than
+    max_bytes the least recently used entries go first
+    """
+
+    def __init__(self, path=None, max_bytes=None, ttl=None):
+        self.path = path or Config.RESPONSE_CACHE_DB
+        self.max_bytes = max_bytes or Config.RESPONSE_CACHE_MAX_BYTES
+        self.ttl = ttl or Config.RESPONSE_CACHE_TTL
+        self.hits = 0
+        self.misses = 0
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def key(prompt, thinking, search, file_ids=()):
+        parts = [prompt, bool(thinking), bool(search)]
+        if file_ids:
+            parts.append(list(file_ids))  # attachments change the answer (ids are per content)
+        raw = json.dumps(parts, ensure_ascii=False)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key):
+        """the cached deltas or None, counts as a hit or a miss"""
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] <= now:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return [(_KIND_NAMES[kind], text) for kind, text in json.loads(zlib.decompress(row[0]))]
+
+    def put(self, key, deltas, ttl=None):
+        """store a finished stream, then drop expired and least recently used entries"""
+        packed = json.dumps([[_KINDS[kind], text] for kind, text in deltas], ensure_ascii=False, separators=(",", ":"))
+        value = zlib.compress(packed.encode(), 9)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, expires, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + (ttl or self.ttl), now),
+            )
+            self._db.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+            # keep the newest entries that fit in max_bytes
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_used DESC, rowid DESC) AS total FROM responses) "
+                "WHERE total > ?)",
+                (self.max_bytes,),
+            )
+
+    def record(self, key, deltas, decoder):
+        """pass a live stream through, caching it only if decoder saw it finish
+
+        a body that just ends (INCOMPLETE, a dropped connection) isn't an answer to replay
+        """
+        seen = []
+        for delta in deltas:
+            seen.append(delta)
+            yield delta
+        if seen and decoder.finished:
+            self.put(key, seen)
+
+    async def arecord(self, key, deltas, decoder):
+        """async version of record()"""
+        seen = []
+        async for delta in deltas:
+            seen.append(delta)
+            yield delta
+        if seen and decoder.finished:
+            self.put(key, seen)
+
+    def stats(self):
+        """hit/miss counters for this process plus what's on disk"""
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
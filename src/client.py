@@ -1,112 +1,218 @@
+import os
 import json
+import time
 import requests
 import base64
-from wasmtime import Linker, Module, Store
-import ctypes
-import struct
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from .config import Config
-from .display import print_status, print_response_start, stream_live
+from .credentials import get_credentials, is_auth_failure
+from .pow import get_executor
+from .stream import THINKING, ANSWER, StreamDecoder
+from .events import DELTAS, SUCCESS, WARNING, Error, Finish, MessageId, Status
+from .metrics import Reply, TurnStats
+from .uploads import MultipartFile
+from .transport import DeepSeekError, get_transport, parse_retry_after
+from .display import print_event, print_status, print_response_start, stream_live
 
-class DeepSeekClient:
-    def __init__(self):
+def drain_response(resp, chunks, timeout):
+    """read the rest of a finished stream so requests can put its connection back in the pool
+
+    a watchdog cuts the connection instead if the server takes longer than timeout to end the body
+    """
+    watchdog = threading.Timer(timeout, shutdown_connection, (resp,))
+    watchdog.daemon = True
+    watchdog.start()
+    try:
+        for _ in chunks:
+            pass
+    except Exception:
+        pass  # cut by the watchdog or the connection broke, either way it's gone
+    finally:
+        watchdog.cancel()
+        resp.close()
+
+def shutdown_connection(resp):
+    """end a blocked read on resp from another thread
+
+    resp.close() doesn't wake a thread that's waiting in recv(), shutting the socket down does
+    """
+    sock = getattr(resp.raw.connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # already gone
+
+def is_json(resp):
+    """whether resp (requests or httpx) is a json body rather than the event stream we asked for"""
+    return resp.headers.get("Content-Type", "").split(";")[0].strip() == "application/json"
+
+def encode_pow_response(challenge, answer):
+    """pack a solved challenge into the x-ds-pow-response header value"""
+    pow_dict = {
+        "algorithm": challenge["algorithm"],
+        "challenge": challenge["challenge"],
+        "salt": challenge["salt"],
+        "answer": answer,
+        "signature": challenge["signature"],
+        "target_path": challenge["target_path"],
+    }
+    
+    return base64.b64encode(json.dumps(pow_dict).encode()).decode()
+
+class BaseClient:
+    """stuff both the sync and async clients need: credentials, headers, pow"""
+    
+    def __init__(self, credentials=None):
         self.config = Config()
-        self.cookies = self._load_cookies()
-        self.token = self._load_token()
+        # shared by every client in the process, a background refresh swaps in new ones
+        self.credentials = credentials or get_credentials()
+        self.transport = get_transport()  # retries, retry budget and circuit breaker, also process wide
         self.session_id = None  # keep session alive
         self.parent_message_id = None  # track conversation
+        self._prefetched_pow = None  # challenge being fetched/solved ahead of time
+        self.store = None  # optional ConversationStore that records every turn
+        self.conversation_id = None  # our id for this session in the store
+        self.cache = None  # optional ResponseCache for prompts that don't continue a conversation
+        self.metrics = None  # optional exporter, gets every finished turn's TurnStats
+        self.session_pool = None  # optional SessionPool, new conversations take a ready session from it
+        self.uploads = None  # optional UploadIndex, attached files already uploaded aren't sent again
+        self.last_stats = None  # TurnStats of the latest turn
+        # read the end of finished streams so the next turn reuses their connection,
+        # one-shot callers turn it off and don't wait for a body they'll never reuse
+        self.keep_alive = True
     
-    def _load_cookies(self):
-        """grab cookies from file if they exist"""
-        try:
-            with open(self.config.COOKIES_FILE, "r") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
+    @property
+    def token(self):
+        return self.credentials.current.token
+    
+    @property
+    def cookies(self):
+        return self.credentials.current.cookies
     
-    def _load_token(self):
-        """get our auth token"""
+    def _check_auth(self, resp, code=None):
+        """tell the credential manager when the api rejected the token a request used"""
+        if is_auth_failure(resp.status_code, code):
+            used = resp.request.headers.get("authorization", "")
+            self.credentials.report_auth_failure(used[len("Bearer "):])
+    
+    def _read_json(self, resp, what):
+        """parse an api response, raising DeepSeekError unless it's a 200 with code 0"""
         try:
-            with open(self.config.TOKEN_FILE, "r") as f:
-                return f.read().strip()
-        except FileNotFoundError:
+            data = resp.json()
+        except ValueError:
+            data = {}
+        if resp.status_code != 200 or data.get("code") != 0:
+            self._check_auth(resp, data.get("code"))
+            raise DeepSeekError(
+                f"{what} failed: {resp.status_code} {data.get('msg') or ''}".strip(),
+                status=resp.status_code,
+                code=data.get("code"),
+                retry_after=parse_retry_after(resp.headers.get("Retry-After")),
+            )
+        return data
+    
+    def _headers(self, pow_header=None):
+        """base headers plus auth (and the pow answer for completions)"""
+        # one snapshot so token and cookies always come from the same login
+        current = self.credentials.current
+        headers = {
+            **self.config.BASE_HEADERS,
+            "authorization": f"Bearer {current.token}",
+            "Cookie": current.cookie_header,
+        }
+        if pow_header:
+            headers["x-ds-pow-response"] = pow_header
+        return headers
+    
+    def _completion_payload(self, session_id, prompt, thinking, search, file_ids=()):
+        return {
+            "chat_session_id": session_id,
+            "parent_message_id": self.parent_message_id,
+            "prompt": prompt,
+            "ref_file_ids": list(file_ids),
+            "thinking_enabled": thinking,
+            "search_enabled": search,
+        }
+    
+    def _start_turn(self, prompt):
+        """start recording a turn if we have a store (call once the session exists)"""
+        if self.store is None:
             return None
+        if self.conversation_id is None:
+            self.conversation_id = self.store.conversation(self.session_id, prompt)
+        return self.store.start_turn(self.conversation_id, prompt, self.parent_message_id)
+    
+    def _cache_key(self, prompt, thinking, search, file_ids=()):
+        """cache key for a stateless call, None when caching doesn't apply"""
+        if self.cache is None or self.parent_message_id is not None:
+            return None  # answers that depend on earlier messages can't be reused
+        return self.cache.key(prompt, thinking, search, file_ids)
+    
+    def _file_ready(self, data, file_id):
+        """whether fetch_files says deepseek has finished processing an upload, raises if it failed"""
+        for info in data["data"]["biz_data"].get("files") or []:
+            if info.get("id") != file_id:
+                continue
+            status = info.get("status") or ""
+            if status == "SUCCESS":
+                return True
+            if "FAIL" in status or "ERROR" in status or status == "CONTENT_EMPTY":
+                if self.uploads is not None:
+                    self.uploads.forget(file_id)
+                raise DeepSeekError(f"Processing {info.get('file_name') or file_id} failed: {status}")
+        return False
+    
+    def _record_stats(self, stats):
+        if self.metrics is not None:
+            self.metrics.record(stats)
+    
+    def conversation(self):
+        """a new, independent conversation on this client's resources
+        
+        the handle has its own session, parent message chain and last_stats but
+        shares credentials, connection pool, pow solvers, store, cache and metrics,
+        so it's cheap: make one per thread/task (or per chat) instead of a client each
+        """
+        other = self._new_handle()
+        other.store, other.cache, other.metrics = self.store, self.cache, self.metrics
+        other.session_pool = self.session_pool
+        other.uploads = self.uploads
+        return other
+    
+    def resume(self, conversation_id=None):
+        """continue a stored conversation, no session round trip needed. False if there's nothing to resume"""
+        found = self.store.resume(conversation_id) if self.store is not None else None
+        if found is None:
+            return False
+        self.conversation_id, self.session_id, self.parent_message_id = found
+        return True
     
     def _compute_pow_answer(self, challenge_str, salt, difficulty, expire_at):
         """solve the proof of work challenge (this is the tricky part)"""
-        prefix = f"{salt}_{expire_at}_"
-        store = Store()
-        linker = Linker(store.engine)
-        
-        with open(self.config.WASM_FILE, "rb") as f:
-            wasm_bytes = f.read()
-        
-        module = Module(store.engine, wasm_bytes)
-        instance = linker.instantiate(store, module)
-        exports = instance.exports(store)
-        
-        memory = exports["memory"]
-        add_to_stack = exports["__wbindgen_add_to_stack_pointer"]
-        alloc = exports["__wbindgen_export_0"]
-        wasm_solve = exports["wasm_solve"]
-        
-        def write_memory(offset, data):
-            base_addr = ctypes.cast(memory.data_ptr(store), ctypes.c_void_p).value
-            ctypes.memmove(base_addr + offset, data, len(data))
-        
-        def read_memory(offset, size):
-            base_addr = ctypes.cast(memory.data_ptr(store), ctypes.c_void_p).value
-            return ctypes.string_at(base_addr + offset, size)
-        
-        def encode_string(text):
-            data = text.encode("utf-8")
-            ptr_val = alloc(store, len(data), 1)
-            ptr = int(ptr_val.value) if hasattr(ptr_val, "value") else int(ptr_val)
-            write_memory(ptr, data)
-            return ptr, len(data)
-        
-        retptr = add_to_stack(store, -16)
-        ptr_challenge, len_challenge = encode_string(challenge_str)
-        ptr_prefix, len_prefix = encode_string(prefix)
-        
-        wasm_solve(store, retptr, ptr_challenge, len_challenge, ptr_prefix, len_prefix, float(difficulty))
-        
-        status = struct.unpack("<i", read_memory(retptr, 4))[0]
-        value = struct.unpack("<d", read_memory(retptr + 8, 8))[0]
-        
-        add_to_stack(store, 16)
-        
-        return int(value) if status != 0 else None
+        # the executor's solvers are shared and compiled once, not rebuilt every message
+        return get_executor().solve(challenge_str, salt, difficulty, expire_at)
     
-    def _create_session(self):
-        """make a new chat session or reuse existing one"""
-        if self.session_id:
-            return self.session_id  # reuse existing session
-        
-        headers = {**self.config.BASE_HEADERS, "authorization": f"Bearer {self.token}"}
-        resp = requests.post(
-            f"{self.config.BASE_URL}/api/v0/chat_session/create",
-            headers=headers,
-            cookies=self.cookies,
-            json={"agent": "chat"}
+    async def _solve_challenge_async(self, data):
+        """_solve_challenge_with_expiry for the event loop, awaits the executor instead of blocking"""
+        if data.get("code") != 0:
+            return None, 0
+        challenge = data["data"]["biz_data"]["challenge"]
+        answer = await get_executor().solve_async(
+            challenge["challenge"],
+            challenge["salt"],
+            challenge["difficulty"],
+            challenge["expire_at"]
         )
-        data = resp.json()
-        session_id = data["data"]["biz_data"]["id"] if data.get("code") == 0 else None
-        
-        if session_id:
-            self.session_id = session_id  # save for reuse
-        
-        return session_id
+        if answer is None:
+            return None, 0
+        return encode_pow_response(challenge, answer), challenge["expire_at"]
     
-    def _get_pow_challenge(self):
-        """get and solve the proof of work challenge"""
-        headers = {**self.config.BASE_HEADERS, "authorization": f"Bearer {self.token}"}
-        resp = requests.post(
-            f"{self.config.BASE_URL}/api/v0/chat/create_pow_challenge",
-            headers=headers,
-            cookies=self.cookies,
-            json={"target_path": "/api/v0/chat/completion"}
-        )
-        data = resp.json()
+    def _solve_challenge(self, data):
+        """solve a create_pow_challenge response, returns the header value or None"""
         if data.get("code") != 0:
             return None
         
@@ -121,44 +227,235 @@ class DeepSeekClient:
         if answer is None:
             return None
         
-        pow_dict = {
-            "algorithm": challenge["algorithm"],
-            "challenge": challenge["challenge"],
-            "salt": challenge["salt"],
-            "answer": answer,
-            "signature": challenge["signature"],
-            "target_path": challenge["target_path"],
-        }
+        return encode_pow_response(challenge, answer)
+    
+    def _solve_challenge_with_expiry(self, data):
+        """same as _solve_challenge but also returns when the answer stops being valid"""
+        pow_header = self._solve_challenge(data)
+        if not pow_header:
+            return None, 0
+        return pow_header, data["data"]["biz_data"]["challenge"]["expire_at"]
+    
+    def _pow_still_valid(self, expire_at):
+        """expire_at is in milliseconds, leave some slack for the request itself"""
+        return expire_at / 1000 - self.config.POW_EXPIRY_MARGIN > time.time()
+
+def create_session():
+    """keep-alive connections for every request instead of a new handshake each time
+    
+    the pool is as big as the async one so threads sharing it don't throw
+    connections away (cookies go in the headers so a credential refresh applies right away)
+    """
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.HTTP_MAX_CONNECTIONS)
+    http.mount("https://", adapter)
+    http.mount("http://", adapter)
+    return http
+
+class DeepSeekClient(BaseClient):
+    """the blocking client, also the shared core behind any number of Conversation handles"""
+    
+    def __init__(self, credentials=None, http=None, executor=None):
+        super().__init__(credentials)
+        self._owns_http = http is None
+        self.http = http or create_session()
+        # lets the pow challenge run while the session is created / the user types,
+        # threads are only started when needed so the size costs nothing for one chat
+        self._executor = executor or ThreadPoolExecutor(max_workers=Config.HTTP_MAX_CONNECTIONS)
+        self._draining = set()  # responses being drained in the background, close() cuts them off
+        self._refills = set()  # timers replacing pooled sessions once they expire, close() cancels them
+    
+    def _new_handle(self):
+        return Conversation(self)
+    
+    def close(self):
+        """close the connection pool and background threads (only if we made them)"""
+        if self._owns_http:
+            self.keep_alive = False
+            for timer in self._refills.copy():
+                timer.cancel()
+            self._executor.shutdown(wait=False, cancel_futures=True)  # drains still queued don't matter now
+            for resp in self._draining.copy():
+                shutdown_connection(resp)  # and running ones end now instead of holding up exit
+            self.http.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def _create_session(self):
+        """make a new chat session (or take a ready one from the pool) or reuse existing one"""
+        if self.session_id:
+            return self.session_id  # reuse existing session
         
-        return base64.b64encode(json.dumps(pow_dict).encode()).decode()
+        session_id = None
+        if self.session_pool is not None:
+            session_id = self.session_pool.take()
+            self.fill_sessions()  # replace it before the next conversation needs one
+        self.session_id = session_id or self.transport.call(self._request_session)  # save for reuse
+        return self.session_id
+    
+    def _send(self, method, path, pow_header=None, headers=None, **kwargs):
+        """one http request with the current auth, a network failure becomes a DeepSeekError without status
+        
+        a stalled connection times out too, the completion stream just gets longer to go quiet
+        """
+        read = self.config.STREAM_IDLE_TIMEOUT if kwargs.get("stream") else self.config.HTTP_TIMEOUT
+        try:
+            return self.http.request(
+                method,
+                f"{self.config.BASE_URL}{path}",
+                headers={**self._headers(pow_header), **(headers or {})},
+                timeout=(self.config.HTTP_TIMEOUT, read),
+                **kwargs
+            )
+        except requests.RequestException as e:
+            raise DeepSeekError(f"Network error: {str(e) or type(e).__name__}") from e
     
-    def chat(self, prompt, thinking=False, search=False):
-        """send a message with optional features"""
-        if not self.token:
-            print_status("No auth token found", "red")
+    def _api(self, method, path, what, **kwargs):
+        """a json api request through the transport, returns the parsed response"""
+        return self.transport.call(lambda: self._read_json(self._send(method, path, **kwargs), what))
+    
+    def _request_session(self):
+        """chat_session/create, one try, returns the new id"""
+        resp = self._send("POST", "/api/v0/chat_session/create", json={"agent": "chat"})
+        return self._read_json(resp, "Creating session")["data"]["biz_data"]["id"]
+    
+    def fill_sessions(self):
+        """top the session pool up in the background"""
+        if self.session_pool is None or not self.token:
             return
+        for _ in range(self.session_pool.reserve()):
+            self._executor.submit(self._pool_session)
+    
+    def _pool_session(self):
+        session_id = None
+        try:
+            session_id = self.transport.call(self._request_session)
+        except Exception:
+            pass  # the pool just stays a session short, the next take() tries again
+        finally:
+            self.session_pool.add(session_id)
+        if session_id:
+            self._refill_at_expiry()
+    
+    def _refill_at_expiry(self):
+        """replace the session just pooled once it's too old to hand out, so an idle process keeps a ready pool"""
+        def refill():
+            self._refills.discard(timer)
+            try:
+                self.fill_sessions()
+            except RuntimeError:
+                pass  # closed in the meantime
+        
+        timer = threading.Timer(self.session_pool.max_age, refill)
+        timer.daemon = True
+        self._refills.add(timer)
+        timer.start()
+    
+    def _fetch_pow(self, target_path="/api/v0/chat/completion"):
+        """get and solve a challenge, returns (header, expire_at, (fetch seconds, solve seconds))
+        
+        one try, raises DeepSeekError. it runs as part of the request it's for, so
+        when that request is retried the retry comes with a fresh challenge
+        """
+        started = time.perf_counter()
+        resp = self._send("POST", "/api/v0/chat/create_pow_challenge", json={"target_path": target_path})
+        data = self._read_json(resp, "PoW challenge")
+        fetched = time.perf_counter()
+        pow_header, expire_at = self._solve_challenge_with_expiry(data)
+        if not pow_header:
+            raise DeepSeekError("Failed to solve PoW")
+        return pow_header, expire_at, (fetched - started, time.perf_counter() - fetched)
+    
+    def _get_pow_challenge(self):
+        """get and solve the proof of work challenge"""
+        return self._fetch_pow()[0]
+    
+    def prefetch_pow(self):
+        """start solving the next challenge in the background (e.g. while the user types)"""
+        if self.token and self._prefetched_pow is None and self.transport.breaker.closed:
+            self._prefetched_pow = self._executor.submit(self._fetch_pow)
+    
+    def _take_pow(self, future, stats):
+        """wait for a background solve, falling back to a fresh one if it expired or failed (or there's none)"""
+        with stats.span("pow_wait"):
+            try:
+                if future is not None:
+                    pow_header, expire_at, timings = future.result()
+                    if self._pow_still_valid(expire_at):
+                        stats.set_pow(timings)
+                        return pow_header
+            except Exception:
+                pass
+            pow_header, _, timings = self._fetch_pow()
+            stats.set_pow(timings)
+            return pow_header
+    
+    def _open_stream(self, prompt, thinking, search, stats, file_ids=()):
+        """everything before the first token: session, pow and the completion request
+        
+        yields Status/Error events and returns the response, or None if it failed
+        (use as `resp = yield from self._open_stream(...)`)
+        """
+        with stats.span("credentials"):
+            token = self.token
+        if not token:
+            yield Error("No auth token found", status=401)
+            return
+        
+        # the challenge doesn't depend on the session so fetch + solve it meanwhile,
+        # unless the breaker is open: then the attempt fetches one if it's let through at all
+        pow_future, self._prefetched_pow = self._prefetched_pow, None
+        if pow_future is None and self.transport.breaker.closed:
+            pow_future = self._executor.submit(self._fetch_pow)
         
         # only create session once
         if not self.session_id:
-            print_status("Creating chat session...", "cyan")
-            session_id = self._create_session()
-            if not session_id:
-                print_status("Failed to create session", "red")
+            yield Status("Creating chat session...")
+            try:
+                with stats.span("session_create"):
+                    session_id = self._create_session()
+            except DeepSeekError as e:
+                self._prefetched_pow = pow_future  # keep it for the next try
+                yield Error(str(e), e.status, e.code, e.retry_after)
                 return
         else:
             session_id = self.session_id
         
-        print_status("Solving proof of work...", "cyan")
-        pow_header = self._get_pow_challenge()
-        if not pow_header:
-            print_status("Failed to solve PoW", "red")
-            return
+        def send():
+            """one try at pow + completion request, a retry solves a fresh challenge"""
+            nonlocal pow_future
+            future, pow_future = pow_future, None
+            pow_header = self._take_pow(future, stats)
+            resp = self._send(
+                "POST",
+                "/api/v0/chat/completion",
+                pow_header,
+                json=self._completion_payload(session_id, prompt, thinking, search, file_ids),
+                stream=True
+            )
+            stats.mark("ttfb")
+            if is_json(resp):
+                # a refusal (bad pow, expired token, rate limit) can come back as a 200 with a json body
+                try:
+                    self._read_json(resp, "Request")
+                finally:
+                    resp.close()
+                raise DeepSeekError("Request failed: got JSON instead of an answer stream", status=resp.status_code)
+            if resp.status_code != 200:
+                self._check_auth(resp)
+                resp.close()
+                raise DeepSeekError(
+                    f"Request failed: {resp.status_code}",
+                    status=resp.status_code,
+                    retry_after=parse_retry_after(resp.headers.get("Retry-After")),
+                )
+            return resp
         
-        headers = {
-            **self.config.BASE_HEADERS,
-            "authorization": f"Bearer {self.token}",
-            "x-ds-pow-response": pow_header
-        }
+        yield Status("Solving proof of work...")
         
         # show enabled features
         features = []
@@ -168,91 +465,208 @@ class DeepSeekClient:
             features.append("search")
         
         if features:
-            print_status(f"Features: {', '.join(features)}", "cyan")
+            yield Status(f"Features: {', '.join(features)}")
         
-        print_status("Sending message...", "cyan")
-        resp = requests.post(
-            f"{self.config.BASE_URL}/api/v0/chat/completion",
-            headers=headers,
-            cookies=self.cookies,
-            json={
-                "chat_session_id": session_id,
-                "parent_message_id": self.parent_message_id,
-                "prompt": prompt,
-                "ref_file_ids": [],
-                "thinking_enabled": thinking,
-                "search_enabled": search,
-            },
-            stream=True
-        )
+        yield Status("Sending message...")
+        try:
+            return (yield from self._retrying(send))
+        except DeepSeekError as e:
+            yield Error(str(e), e.status, e.code, e.retry_after)
+    
+    def _retrying(self, send):
+        """transport.call() for _open_stream, every retry shows up as a warning status"""
+        attempts = self.transport.attempts(send)
+        while True:
+            try:
+                error, delay = next(attempts)
+            except StopIteration as done:
+                return done.value
+            yield Status(f"{error}, retrying in {delay:.1f}s", WARNING)
+            time.sleep(delay)
+    
+    def _iter_deltas(self, resp, turn=None, decoder=None):
+        """decode the completion stream into (kind, text) and remember the reply id"""
+        decoder = decoder or StreamDecoder()
+        # read big chunks and split lines ourselves instead of iter_lines()
+        chunks = resp.iter_content(chunk_size=self.config.STREAM_CHUNK_SIZE)
+        try:
+            for delta in decoder.iter_chunks(chunks):
+                if turn is not None:
+                    turn.add(*delta)
+                yield delta
+        except requests.RequestException as e:
+            raise DeepSeekError(f"Connection lost mid answer: {str(e) or type(e).__name__}") from e
+        finally:
+            # also runs when the stream is cut off, so partial answers aren't lost
+            if turn is not None:
+                turn.finish(decoder.response_message_id, decoder.finished)
+            self._release(resp, chunks, decoder.finished)
         
-        if resp.status_code != 200:
-            print_status(f"Request failed: {resp.status_code}", "red")
+        # update parent message id
+        if decoder.response_message_id:
+            self.parent_message_id = decoder.response_message_id
+    
+    def _release(self, resp, chunks, finished):
+        """done with a completion stream, hand its connection back without making the caller wait"""
+        if not finished or not self.keep_alive:
+            resp.close()  # cut off mid answer (error, ctrl-c) or nobody will reuse the connection
             return
+        # only the end of the body is left, read it in the background so the turn ends now
+        self._draining.add(resp)
+        future = self._executor.submit(drain_response, resp, chunks, self.config.STREAM_DRAIN_TIMEOUT)
+        future.add_done_callback(lambda _: self._draining.discard(resp))
+    
+    def events(self, prompt, thinking=False, search=False, files=None):
+        """send a message and yield what happens as Event objects, no rendering at all
         
-        print_response_start()
+        Status events while the request is set up, then Thinking/Answer deltas,
+        MessageId once the reply has one and Finish (with the turn's TurnStats).
+        a refused request ends with an Error event instead. files are paths to attach
+        """
+        stats = self.last_stats = TurnStats()
+        file_ids = []
+        for path in files or ():
+            yield Status(f"Attaching {os.path.basename(path)}...")
+            try:
+                file_ids.append(self.upload_file(path))
+            except DeepSeekError as e:
+                yield Error(str(e), e.status, e.code, e.retry_after)
+                return
+            except OSError as e:
+                yield Error(f"Can't read {path}: {e.strerror or e}")
+                return
         
-        response_message_id = None
-        thinking_content = ""
-        main_content = ""
+        key = self._cache_key(prompt, thinking, search, file_ids)
+        cached = self.cache.get(key) if key is not None else None
+        parent_message_id = self.parent_message_id
         
-        def content_generator():
-            nonlocal response_message_id, thinking_content, main_content
-            for line in resp.iter_lines():
-                if not line:
-                    continue
-                
-                decoded = line.decode('utf-8', errors='ignore')
-                
-                if decoded.startswith("data:"):
-                    data_str = decoded[5:].strip()
-                    
-                    if not data_str or data_str == "{}":
-                        continue
-                    
-                    try:
-                        chunk = json.loads(data_str)
-                        
-                        # extract response message id
-                        if "response_message_id" in chunk:
-                            response_message_id = chunk["response_message_id"]
-                        
-                        if "v" in chunk and isinstance(chunk["v"], dict):
-                            if "response" in chunk["v"]:
-                                resp_data = chunk["v"]["response"]
-                                if "message_id" in resp_data:
-                                    response_message_id = resp_data["message_id"]
-                        
-                        # separate thinking from main content
-                        path = chunk.get("p", "")
-                        
-                        if "v" in chunk:
-                            v_value = chunk["v"]
-                            
-                            # skip thinking content, only show main response
-                            if "thinking" in path:
-                                thinking_content += str(v_value) if isinstance(v_value, str) else ""
-                                continue
-                            
-                            if isinstance(v_value, str) and v_value:
-                                main_content += v_value
-                                yield v_value
-                            
-                            elif isinstance(v_value, list):
-                                for item in v_value:
-                                    if item.get("p") == "status" and item.get("v") == "FINISHED":
-                                        break
-                    except:
-                        pass
+        if cached is not None:
+            yield Status("Answer from cache", SUCCESS)
+            stats.cached = True
+            deltas = stats.watch(iter(cached), self._record_stats)
+        else:
+            resp = yield from self._open_stream(prompt, thinking, search, stats, file_ids)
+            if resp is None:
+                return
+            decoder = StreamDecoder()
+            deltas = self._iter_deltas(resp, self._start_turn(prompt), decoder)
+            if key is not None:
+                deltas = self.cache.record(key, deltas, decoder)
+            deltas = stats.watch(deltas, self._record_stats)
         
-        full_content = stream_live(content_generator())
+        try:
+            for kind, text in deltas:
+                yield DELTAS[kind](text)
+        except DeepSeekError as e:
+            yield Error(str(e), e.status, e.code, e.retry_after)  # the connection broke mid answer
+            return
+        finally:
+            deltas.close()  # when the consumer stops early this closes the http stream right away
         
-        # update parent message id
-        if response_message_id:
-            self.parent_message_id = response_message_id
+        if self.parent_message_id != parent_message_id:
+            yield MessageId(self.parent_message_id)
+        yield Finish(stats)
+    
+    def stream(self, prompt, thinking=False, search=False, files=None):
+        """send a message and yield (kind, text) deltas, no rendering at all
         
-        return full_content
+        kind is "thinking" or "answer". raises DeepSeekError if the request fails
+        """
+        for event in self.events(prompt, thinking, search, files):
+            if event.kind == ANSWER or event.kind == THINKING:
+                yield event.kind, event.text
+            elif event.kind == "error":
+                raise DeepSeekError(event.message, event.status, event.code, event.retry_after)
+    
+    def chat(self, prompt, thinking=False, search=False, files=None):
+        """send a message with optional features, returns the answer (a Reply, timings on .stats)
+        
+        the rich cli on top of events(): statuses as status lines, the answer as live markdown
+        """
+        events = self.events(prompt, thinking, search, files)
+        for event in events:
+            if event.kind == ANSWER:
+                break
+            print_event(event)
+            if event.kind == "error":
+                return
+        else:
+            return Reply("", self.last_stats)  # finished without any answer text
+        
+        print_response_start()
+        answer = [event.text]
+        errors = []
+        
+        def content_generator():
+            yield event.text
+            for later in events:
+                if later.kind == ANSWER:
+                    answer.append(later.text)
+                    yield later.text
+                elif later.kind == "error":
+                    errors.append(later)  # shown once the partial answer is on screen
+        
+        try:
+            stream_live(content_generator())
+        except KeyboardInterrupt:
+            # stop this answer only: close the stream (and its connection), keep the session going
+            events.close()
+            print_status("Stopped", "yellow")
+        for error in errors:
+            print_event(error)
+        return Reply("".join(answer), self.last_stats)
     
     def upload_file(self, file_path):
-        """upload a file and get its id"""
-        pass  # disabled
\ No newline at end of file
+        """upload a file and get its id, once it's ready to be attached
+        
+        the file is streamed from disk, and content that's already in the upload
+        index isn't uploaded again at all
+        """
+        digest = self.uploads.digest(file_path) if self.uploads is not None else None
+        if digest is not None:
+            file_id = self.uploads.get(digest)
+            if file_id:
+                return file_id
+        
+        body = MultipartFile(file_path)
+        
+        def send():
+            """one try, with its own challenge, the body is read from disk again on a retry"""
+            pow_header = self._fetch_pow("/api/v0/file/upload_file")[0]
+            resp = self._send(
+                "POST",
+                "/api/v0/file/upload_file",
+                pow_header,
+                headers={"Content-Type": body.content_type},
+                data=body
+            )
+            return self._read_json(resp, "Upload")["data"]["biz_data"]["id"]
+        
+        file_id = self.transport.call(send)
+        self._wait_for_file(file_id)
+        if digest is not None:
+            self.uploads.put(digest, file_id, os.path.basename(file_path), body.size)
+        return file_id
+    
+    def _wait_for_file(self, file_id):
+        """deepseek parses uploads before they can be used, poll until it's done"""
+        deadline = time.monotonic() + self.config.UPLOAD_TIMEOUT
+        while True:
+            data = self._api("GET", "/api/v0/file/fetch_files", "Checking upload", params={"file_ids": file_id})
+            if self._file_ready(data, file_id):
+                return
+            if time.monotonic() > deadline:
+                raise DeepSeekError(f"Upload {file_id} still processing after {self.config.UPLOAD_TIMEOUT}s")
+            time.sleep(self.config.UPLOAD_POLL_INTERVAL)
+
+class Conversation(DeepSeekClient):
+    """one chat on a shared DeepSeekClient, from client.conversation()
+    
+    safe to use from its own thread while other conversations run on the same
+    client, closing it leaves the shared resources alone
+    """
+    
+    def __init__(self, client):
+        super().__init__(client.credentials, client.http, client._executor)
+        self._draining = client._draining
+        self._refills = client._refills
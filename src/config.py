@@ -1,33 +1,68 @@
 import os
-import time
+import sys
 import warnings
-from dotenv import load_dotenv
-from rich.console import Console
 
 # shut up those annoying warnings
 warnings.filterwarnings("ignore")
 
-# load our secret stuff from data folder
-load_dotenv("data/.env")
+_console = None
 
-console = Console()
+def get_console():
+    """rich is only imported the first time we actually print something"""
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
 
 class Config:
+    # filled in by load_env(), only needed when we have to log in
     DEEPSEEK_EMAIL = os.getenv('DEEPSEEK_EMAIL')
     DEEPSEEK_PASSWORD = os.getenv('DEEPSEEK_PASSWORD')
     
+    # raw/jsonl output: no status chatter on stdout, errors still go to stderr
+    QUIET = False
+    
     # browser stuff that usually works
     HEADLESS = True
-    AUTH_WAIT_TIME = 10
+    AUTH_DEADLINE = 30  # seconds for the whole browser login, not per step
+    AUTH_POLL_INTERVAL = 0.25  # how often we check localStorage for the token
+    LOGIN_API_PATH = "/api/v0/users/login"
+    # keep chrome's profile between logins, re-auth is then usually just a page reload (None = fresh every time)
+    BROWSER_PROFILE_DIR = None  # e.g. "data/browser_profile"
+    BROWSER_KEEP_ALIVE = False  # leave the browser running for the next refresh (long running processes)
     
     # where we keep our files now
+    CREDENTIALS_FILE = "data/credentials.json"  # cookies + token + login time, written atomically
+    CREDENTIALS_LOCK_FILE = "data/credentials.lock"  # held by whichever process is logging in
+    # what older versions wrote, only read when credentials.json doesn't exist yet
     COOKIES_FILE = "data/deepseek_cookies.json"
     TOKEN_FILE = "data/auth_token.txt"
     LAST_LOGIN_FILE = "data/last_login.txt"
     WASM_FILE = "data/sha3_wasm_bg.7b9ca65ddd.wasm"
     
-    # session expires after 1 hour (probably)
+    # compiled wasm gets cached here so startup skips compilation (None to disable)
+    POW_CACHE_DIR = "data/wasm_cache"
+    
+    # which pow solver to use: "wasm", "native" or "auto" (benchmark both at startup)
+    POW_BACKEND = "auto"
+    POW_BATCH_SIZE = 1024  # nonces the native solver checks per pass
+    POW_BENCH_ANSWER = 4096  # nonce used for the startup benchmark
+    POW_EXPIRY_MARGIN = 5  # seconds, don't use a prefetched answer closer than this to expiring
+    # where solves run: "inline" (calling thread), "thread" or "process" pool, or "auto"
+    # (threads for wasm, which runs without the gil, processes for the native solver)
+    POW_EXECUTOR = "auto"
+    POW_WORKERS = None  # pool size, None = one per cpu
+    
+    # tokens younger than this are trusted without asking the api, older ones get probed
     SESSION_TIMEOUT = 3600
+    PROBE_PATH = "/api/v0/users/current"  # cheap authenticated request to test a token
+    AUTH_ERROR_CODES = (40001, 40002, 40003)  # deepseek's "bad/expired token" codes
+    
+    # background refresh for long running processes (interactive, batch, server)
+    CREDENTIAL_REFRESH_MARGIN = 300  # seconds before a known expiry to log in again
+    CREDENTIAL_PROBE_INTERVAL = 600  # how often to probe tokens without an expiry
+    CREDENTIAL_RETRY_DELAY = 60  # wait after a failed background login
     
     # api settings that deepseek expects
     BASE_URL = "https://chat.deepseek.com"
@@ -39,23 +74,89 @@ class Config:
         "Content-Type": "application/json",
     }
     
+    # local transcript history, None turns recording off
+    CONVERSATIONS_DB = "data/conversations.db"
+    CONVERSATION_FLUSH_INTERVAL = 1.0  # seconds between writes while an answer streams in
+    CONVERSATION_TITLE_LENGTH = 80
+    
+    # opt-in (--cache) cache of answers to prompts that don't continue a conversation
+    RESPONSE_CACHE_DB = "data/response_cache.db"
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # compressed, least recently used entries go first
+    RESPONSE_CACHE_TTL = 24 * 3600  # seconds an answer stays valid
+    
+    # file attachments, already uploaded content is found again by its hash (None = always upload)
+    UPLOADS_DB = "data/uploads.db"
+    UPLOAD_TTL = 7 * 24 * 3600  # seconds we trust an old file id
+    UPLOAD_CHUNK_SIZE = 256 * 1024  # bytes read from disk per write to the socket
+    UPLOAD_MMAP_THRESHOLD = 8 * 1024 * 1024  # bigger files are read through mmap
+    UPLOAD_POLL_INTERVAL = 1.0  # seconds between checks while deepseek processes a file
+    UPLOAD_TIMEOUT = 120  # give up waiting for processing after this
+    
+    # sessions created ahead of time for new conversations (interactive /new, batch items,
+    # server requests), kept small so we don't sit on server resources
+    SESSION_POOL_SIZE = 2
+    SESSION_POOL_MAX_AGE = 600  # seconds, older ready sessions are thrown away
+    
+    # pooled http settings for the async client (http2 needs `pip install httpx[http2]`)
+    HTTP2 = False
+    HTTP_MAX_CONNECTIONS = 20
+    HTTP_TIMEOUT = 30  # connect, and read for everything but the completion stream
+    STREAM_IDLE_TIMEOUT = 120  # seconds the completion stream may go quiet (model thinking) before we give up
+    STREAM_CHUNK_SIZE = 16384  # bytes per read from the completion stream
+    STREAM_DRAIN_TIMEOUT = 2  # seconds to wait for the end of a finished stream before dropping its connection
+    
+    # every api request (session, pow challenge, completion, uploads) goes through one
+    # transport per process: overload failures (network, 429, 5xx) are retried with a
+    # fresh pow, bounded by a retry budget, and a circuit breaker fails fast during outages
+    RETRY_MAX_ATTEMPTS = 3  # per request, including the first
+    RETRY_BACKOFF_BASE = 0.5  # seconds, doubles every retry (jittered)
+    RETRY_BACKOFF_MAX = 8
+    RETRY_AFTER_MAX = 30  # a longer Retry-After is handed to the caller instead of waited out
+    RETRY_BUDGET_RATIO = 0.2  # retries earned per request
+    RETRY_BUDGET_BURST = 10  # retries that can be saved up
+    CIRCUIT_FAILURE_THRESHOLD = 5  # overload failures in a row before the breaker opens
+    CIRCUIT_RESET_TIMEOUT = 30  # seconds to fail fast before one probe request goes out
+    
+    # batch mode
+    BATCH_CONCURRENCY = 4
+    BATCH_MAX_RETRIES = 3
+    BATCH_BACKOFF_BASE = 2  # seconds, doubles every retry
+    BATCH_BACKOFF_MAX = 60
+    
+    # server mode, localhost only unless you really mean it
+    SERVER_HOST = "127.0.0.1"
+    SERVER_PORT = 8000
+    SERVER_MAX_CONVERSATIONS = 1000  # histories we remember the session for
+    
+    _env_loaded = False
+    
+    @staticmethod
+    def load_env():
+        """load our secret stuff from data folder (skipped entirely when the session is still good)"""
+        if Config._env_loaded:
+            return
+        from dotenv import load_dotenv
+        
+        load_dotenv("data/.env")
+        Config.DEEPSEEK_EMAIL = os.getenv('DEEPSEEK_EMAIL')
+        Config.DEEPSEEK_PASSWORD = os.getenv('DEEPSEEK_PASSWORD')
+        Config._env_loaded = True
+    
     @staticmethod
     def print_status(message, style="white"):
         """print stuff with colors because it looks nice"""
-        console.print(f"[{style}][DeepSeek][/{style}] {message}")
+        if Config.QUIET:
+            _print_quiet(message, style)
+            return
+        get_console().print(f"[{style}][DeepSeek][/{style}] {message}")
     
     @staticmethod
     def needs_reauth():
-        """check if we need to login again"""
-        try:
-            with open(Config.LAST_LOGIN_FILE, 'r') as f:
-                last_login = float(f.read().strip())
-            return (time.time() - last_login) > Config.SESSION_TIMEOUT
-        except:
-            return True
-    
-    @staticmethod
-    def update_login_time():
-        """remember when we logged in"""
-        with open(Config.LAST_LOGIN_FILE, 'w') as f:
-            f.write(str(time.time()))
\ No newline at end of file
+        """check if we need to login again (real expiry check, see credentials.py)"""
+        from .credentials import get_credentials
+        return get_credentials().needs_login()
+
+def _print_quiet(message, style):
+    """in quiet mode only errors get through, as plain text on stderr"""
+    if style == "red":
+        sys.stderr.write(f"[DeepSeek] {message}\n")
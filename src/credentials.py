@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import base64
+import threading
+from .config import Config
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+def token_expiry(token):
+    """exp claim if the token is a jwt, None if it's opaque"""
+    parts = token.split(".") if token else []
+    if len(parts) != 3:
+        return None
+    try:
+        payload = parts[1] + "=" * (-len(parts[1]) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp else None
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+class Credentials:
+    """one consistent set of cookies + token, never modified once made"""
+
+    __slots__ = ("cookies", "token", "login_time", "expires_at")
+
+    def __init__(self, cookies, token, login_time=None):
+        self.cookies = cookies or {}
+        self.token = token
+        self.login_time = login_time
+        self.expires_at = token_expiry(token)
+
+    @property
+    def cookie_header(self):
+        return "; ".join(f"{name}={value}" for name, value in self.cookies.items())
+
+    @classmethod
+    def load(cls):
+        """read the shared record, or the three files older versions wrote"""
+        try:
+            with open(Config.CREDENTIALS_FILE, "r") as f:
+                record = json.load(f)
+            return cls(record.get("cookies"), record.get("token"), record.get("login_time"))
+        except (FileNotFoundError, ValueError, AttributeError):
+            return cls._load_legacy()
+
+    @classmethod
+    def _load_legacy(cls):
+        try:
+            with open(Config.COOKIES_FILE, "r") as f:
+                cookies = json.load(f)
+        except (FileNotFoundError, ValueError):
+            cookies = {}
+
+        try:
+            with open(Config.TOKEN_FILE, "r") as f:
+                token = f.read().strip() or None
+        except FileNotFoundError:
+            token = None
+
+        try:
+            with open(Config.LAST_LOGIN_FILE, "r") as f:
+                login_time = float(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            login_time = None
+
+        return cls(cookies, token, login_time)
+
+    def save(self):
+        """write the whole record at once, readers see the old one or the new one, never half"""
+        path = Config.CREDENTIALS_FILE
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        record = {"cookies": self.cookies, "token": self.token, "login_time": self.login_time}
+        tmp = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(record, f, indent=2)
+        os.replace(tmp, path)
+        # the record replaces the old files, left around load() would fall back to them
+        # once credentials.json is deleted and quietly bring back a stale token
+        for legacy in (Config.COOKIES_FILE, Config.TOKEN_FILE, Config.LAST_LOGIN_FILE):
+            try:
+                os.remove(legacy)
+            except FileNotFoundError:
+                pass
+
+class FileLock:
+    """exclusive lock on a file, shared between processes (and threads)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue  # LK_LOCK gives up after ~10s, keep waiting
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class CredentialManager:
+    """hands out the current credentials and refreshes them before they lapse
+
+    clients read `current` on every request. a refresh logs in on the side and
+    then swaps the whole Credentials object in one assignment, so requests in
+    flight keep the old set and the next ones get the new one, nobody waits.
+    the record on disk is shared by every process, a stat per read notices when
+    another one logged in
+    """
+
+    def __init__(self, credentials=None):
+        self._watch = credentials is None  # passed in credentials never get replaced from disk
+        self._mtime = None
+        self._current = credentials or Credentials(None, None)
+        if self._watch:
+            self.reload()
+        self._refresh_lock = threading.Lock()  # only one browser login at a time
+        self._wake = threading.Event()
+        self._stale_token = None  # token the api told us is dead
+        self._thread = None
+        self._loop = None
+
+    @property
+    def current(self):
+        if self._watch and self._record_mtime() != self._mtime:
+            self.reload()
+        return self._current
+
+    @staticmethod
+    def _record_mtime():
+        try:
+            return os.stat(Config.CREDENTIALS_FILE).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self):
+        """pick up credentials another process wrote"""
+        self._mtime = self._record_mtime()
+        self._current = Credentials.load()
+
+    def is_expiring(self, margin=0):
+        """only answerable for tokens that carry an exp, opaque ones return False"""
+        current = self.current
+        if not current.token:
+            return True
+        if current.expires_at is None:
+            return False
+        return time.time() > current.expires_at - margin
+
+    def probe(self):
+        """ask the api if the token still works: True, False, or None if we couldn't tell"""
+        return probe_credentials(self.current)
+
+    def needs_login(self):
+        """real check instead of assuming everything dies after an hour"""
+        current = self.current
+        if not current.token or self._stale_token == current.token:
+            return True
+        if current.expires_at is not None:
+            return self.is_expiring()
+        if current.login_time and time.time() - current.login_time < Config.SESSION_TIMEOUT:
+            return False  # recent enough, don't spend a round trip on it
+        # old opaque token, it might still be fine, ask before opening a browser
+        return self.probe() is False
+
+    def report_auth_failure(self, token):
+        """a request got rejected for auth, wake the refresher (once per token)"""
+        if token and token == self.current.token and self._stale_token != token:
+            self._stale_token = token
+            self._wake.set()
+
+    async def refresh_async(self):
+        """log in with the browser and swap the new credentials in
+
+        across processes only the one holding the lock logs in, everyone who
+        was waiting on it picks up the fresh record instead of starting chrome too
+        """
+        import asyncio
+        from .auth import AuthExtractor
+
+        before = self.current.token
+        lock = FileLock(Config.CREDENTIALS_LOCK_FILE)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, lock.acquire)
+        try:
+            self.reload()
+            if self._current.token and self._current.token != before:
+                return True  # somebody else logged in while we waited
+
+            cookies, token = await AuthExtractor().extract_credentials()
+            if not cookies or not token:
+                return False
+            credentials = Credentials(cookies, token, time.time())
+            credentials.save()
+            self._mtime = self._record_mtime()
+            self._current = credentials
+            return True
+        finally:
+            lock.release()
+
+    def refresh(self):
+        """blocking refresh, if one is already running just wait for that one"""
+        if not self._refresh_lock.acquire(blocking=False):
+            with self._refresh_lock:
+                return bool(self.current.token)
+        try:
+            # one loop for every refresh, a kept-alive browser is tied to the loop it started on
+            if self._loop is None:
+                import asyncio  # only now, a process with a good session never needs it
+                self._loop = asyncio.new_event_loop()
+            return self._loop.run_until_complete(self.refresh_async())
+        finally:
+            self._refresh_lock.release()
+
+    def _should_refresh(self):
+        current = self.current
+        if self._stale_token == current.token:
+            return True
+        if current.expires_at is not None:
+            return self.is_expiring(Config.CREDENTIAL_REFRESH_MARGIN)
+        return self.probe() is False
+
+    def _next_check(self):
+        """seconds until it's worth looking again"""
+        expires_at = self.current.expires_at
+        if expires_at is None:
+            return Config.CREDENTIAL_PROBE_INTERVAL
+        due = expires_at - Config.CREDENTIAL_REFRESH_MARGIN - time.time()
+        return max(1, min(due, Config.CREDENTIAL_PROBE_INTERVAL))
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._next_check())
+            self._wake.clear()
+            try:
+                if self._should_refresh():
+                    Config.print_status("Refreshing login in the background...", "yellow")
+                    if not self.refresh():
+                        self._wake.wait(Config.CREDENTIAL_RETRY_DELAY)
+            except Exception as e:
+                Config.print_status(f"Background login failed: {e}", "red")
+                self._wake.wait(Config.CREDENTIAL_RETRY_DELAY)
+
+    def start_background_refresh(self):
+        """for long running processes: keep credentials fresh from a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="credential-refresh", daemon=True)
+            self._thread.start()
+
+def probe_credentials(credentials):
+    """one cheap authenticated request: True if the api accepts them, False if not, None if unsure"""
+    import requests
+
+    if not credentials.token:
+        return False
+    try:
+        resp = requests.get(
+            f"{Config.BASE_URL}{Config.PROBE_PATH}",
+            headers={
+                **Config.BASE_HEADERS,
+                "authorization": f"Bearer {credentials.token}",
+                "Cookie": credentials.cookie_header,
+            },
+            timeout=Config.HTTP_TIMEOUT,
+        )
+    except requests.RequestException:
+        return None
+
+    if is_auth_failure(resp.status_code, None):
+        return False
+    try:
+        data = resp.json()
+    except ValueError:
+        return None
+    code = data.get("code") if isinstance(data, dict) else None
+    if is_auth_failure(resp.status_code, code):
+        return False
+    if resp.status_code == 200 and code == 0:
+        return True
+    return None  # rate limited or a server error, says nothing about the token
+
+def is_auth_failure(status, code):
+    """does this response mean our token/cookies are no good anymore"""
+    return status == 401 or code in Config.AUTH_ERROR_CODES
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_credentials():
+    """shared credential manager for the whole process"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = CredentialManager()
+    return _manager
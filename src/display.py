@@ -1,50 +1,187 @@
-from rich.console import Console
-from rich.markdown import Markdown
-from rich.panel import Panel
-from rich.prompt import Prompt
-from rich.live import Live
-from rich.rule import Rule
+import threading
 import time
+import re
+from .config import Config, get_console
 
-console = Console()
+# rich's markdown/live/panel modules are imported inside the functions that use
+# them, raw output and the auth check never need them
+
+# a blank line followed by one of these doesn't end the block (the list keeps going)
+_LIST_ITEM = re.compile(r"([-*+]|\d+[.)])(\s|$)")
 
 def print_status(message, style="white"):
     """print status messages with style"""
-    console.print(f"[{style}][[DeepSeek]][/{style}] {message}", justify="left")
+    if Config.QUIET:
+        return Config.print_status(message, style)
+    get_console().print(f"[{style}][[DeepSeek]][/{style}] {message}", justify="left")
+
+# Status.level -> rich style
+_STATUS_STYLES = {"info": "cyan", "success": "green", "warning": "yellow"}
+
+def print_event(event):
+    """print a client Status or Error event as a status line, other events are ignored"""
+    if event.kind == "status":
+        print_status(event.message, _STATUS_STYLES.get(event.level, "white"))
+    elif event.kind == "error":
+        print_status(event.message, "red")
 
 def print_response_start():
     """show when response starts"""
+    from rich.rule import Rule
+    
+    console = get_console()
     console.print()
     console.print(Rule("[bold cyan]Response[/bold cyan]", style="cyan", align="left"))
     console.print()
 
+class IncrementalMarkdown:
+    """markdown that only re-parses the block still being written
+    
+    finished blocks (everything before the last blank line outside a code
+    fence) are rendered once and cached per width, only the tail gets parsed
+    again. text is just queued on append and parsed when Live actually
+    refreshes, so chunks arriving between frames cost nothing extra.
+    """
+    
+    def __init__(self, code_theme="monokai", justify="left"):
+        self.code_theme = code_theme
+        self.justify = justify
+        self._lock = threading.Lock()
+        self._chunks = []  # everything we got, for the final text
+        self._pending = []  # chunks not looked at by the renderer yet
+        self._blocks = []  # finished markdown blocks
+        self._tail = ""  # the block still being written
+        self._in_fence = False  # state after the last complete line of the tail
+        self._prev_blank = False
+        self._cache_width = None
+        self._cache_segments = []  # rendered self._blocks[:self._cache_count]
+        self._cache_count = 0
+        self._cache_new_line = False  # whether the next block needs a blank line first
+    
+    @property
+    def text(self):
+        with self._lock:
+            return "".join(self._chunks)
+    
+    def append(self, chunk):
+        with self._lock:
+            self._chunks.append(chunk)
+            self._pending.append(chunk)
+    
+    def _absorb(self):
+        """move new text into the tail and split off any blocks that are done"""
+        with self._lock:
+            if not self._pending:
+                return
+            new_text = "".join(self._pending)
+            self._pending.clear()
+        
+        # only scan lines we haven't seen complete yet
+        pos = self._tail.rfind("\n") + 1
+        self._tail += new_text
+        
+        split_at = None
+        while True:
+            end = self._tail.find("\n", pos)
+            if end == -1:
+                break  # last line is still incomplete
+            line = self._tail[pos:end]
+            stripped = line.strip()
+            
+            # a complete, unindented line after a blank one starts a new block
+            # (unless it's the next item of the same list)
+            if self._prev_blank and stripped and not line[0].isspace() and not _LIST_ITEM.match(line):
+                split_at = pos
+            
+            if stripped.startswith("```") or stripped.startswith("~~~"):
+                self._in_fence = not self._in_fence
+            self._prev_blank = not stripped and not self._in_fence
+            pos = end + 1
+        
+        if split_at is not None:
+            self._blocks.append(self._tail[:split_at].rstrip("\n"))
+            self._tail = self._tail[split_at:]
+    
+    @staticmethod
+    def _join(out, markdown, segments, new_line):
+        """add a block's segments after what's already rendered, like Markdown
+        joins its own elements
+        
+        new_line is whether the previous block wants a blank line after it (only
+        a horizontal rule doesn't). lists and quotes rendered on their own
+        already start with that blank line
+        """
+        from rich.segment import Segment
+        
+        segments = list(segments)
+        if new_line and segments and segments[0].text != "\n":
+            out.append(Segment.line())
+        out.extend(segments)
+        tokens = markdown.parsed
+        return bool(tokens) and tokens[-1].type != "hr"
+    
+    def _markdown(self, text):
+        from rich.markdown import Markdown
+        
+        return Markdown(text, code_theme=self.code_theme, justify=self.justify)
+    
+    def __rich_console__(self, console, options):
+        self._absorb()
+        
+        width = options.max_width
+        if width != self._cache_width:
+            self._cache_width = width
+            self._cache_segments = []
+            self._cache_count = 0
+            self._cache_new_line = False
+        
+        # render blocks that finished since the last frame, joined the same way
+        # Markdown joins its own elements (one new line between them)
+        render_options = options.update(height=None)
+        for block in self._blocks[self._cache_count:]:
+            markdown = self._markdown(block)
+            self._cache_new_line = self._join(
+                self._cache_segments, markdown, console.render(markdown, render_options), self._cache_new_line
+            )
+        self._cache_count = len(self._blocks)
+        
+        yield from self._cache_segments
+        
+        if self._tail.strip():
+            tail = []
+            markdown = self._markdown(self._tail)
+            self._join(tail, markdown, console.render(markdown, render_options), self._cache_new_line)
+            yield from tail
+
 def stream_live(content_generator):
     """stream content live as it comes in with markdown rendering"""
-    full_content = ""
+    from rich.live import Live
+    from rich.panel import Panel
     
-    # create a panel that updates live
-    with Live(console=console, refresh_per_second=10) as live:
+    body = IncrementalMarkdown(code_theme="monokai")
+    
+    # the panel is built once, Live redraws it 10 times a second on its own
+    panel = Panel(
+        body,
+        border_style="bright_cyan",
+        padding=(1, 2),
+        title="[bold white]DeepSeek[/bold white]",
+        title_align="left"
+    )
+    
+    with Live(panel, console=get_console(), refresh_per_second=10):
         for chunk in content_generator:
             if chunk:
-                full_content += chunk
-                
-                # render current content as markdown
-                md = Markdown(full_content, code_theme="monokai", justify="left")
-                panel = Panel(
-                    md,
-                    border_style="bright_cyan",
-                    padding=(1, 2),
-                    title="[bold white]DeepSeek[/bold white]",
-                    title_align="left"
-                )
-                live.update(panel)
-    
-    return full_content
+                body.append(chunk)
+    
+    return body.text
 
 def get_user_input(prompt_text="You"):
     """get input from user with nice prompt"""
+    from rich.prompt import Prompt
+    
     return Prompt.ask(f"\n[bold green]{prompt_text}[/bold green]")
 
 def print_goodbye():
     """say goodbye when exiting"""
-    console.print("\n[yellow]Goodbye![/yellow]\n", justify="left")
\ No newline at end of file
+    get_console().print("\n[yellow]Goodbye![/yellow]\n", justify="left")
\ No newline at end of file
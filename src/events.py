@@ -0,0 +1,77 @@
+from .stream import THINKING, ANSWER
+
+# Status.level values, the cli picks colors for them
+INFO = "info"
+SUCCESS = "success"
+WARNING = "warning"
+
+class Event:
+    """something that happened during a chat turn, `kind` says which"""
+
+    __slots__ = ()
+    kind = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+class Status(Event):
+    """progress before the answer starts (session, pow, sending), for showing to a user"""
+
+    __slots__ = ("message", "level")
+    kind = "status"
+
+    def __init__(self, message, level=INFO):
+        self.message = message
+        self.level = level
+
+class Thinking(Event):
+    """a piece of the deep-think reasoning"""
+
+    __slots__ = ("text",)
+    kind = THINKING
+
+    def __init__(self, text):
+        self.text = text
+
+class Answer(Event):
+    """a piece of the answer"""
+
+    __slots__ = ("text",)
+    kind = ANSWER
+
+    def __init__(self, text):
+        self.text = text
+
+class MessageId(Event):
+    """the id deepseek gave the reply, the parent of the next message"""
+
+    __slots__ = ("message_id",)
+    kind = "message_id"
+
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+class Finish(Event):
+    """the turn is over, always the last event unless there was an Error"""
+
+    __slots__ = ("stats",)
+    kind = "finish"
+
+    def __init__(self, stats):
+        self.stats = stats
+
+class Error(Event):
+    """the api refused the turn, nothing else follows"""
+
+    __slots__ = ("message", "status", "code", "retry_after")
+    kind = "error"
+
+    def __init__(self, message, status=None, code=None, retry_after=None):
+        self.message = message
+        self.status = status
+        self.code = code
+        self.retry_after = retry_after
+
+# (kind, text) stream deltas to their event class
+DELTAS = {THINKING: Thinking, ANSWER: Answer}
@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from .stream import THINKING
+
+# durations in seconds. ttfb/ttft/total count from the start of the turn, the rest are spans
+PHASES = (
+    "credentials",  # checking/loading credentials (includes a login if one was needed)
+    "session_create",  # chat_session/create, None when the session was reused
+    "challenge_fetch",  # create_pow_challenge round trip
+    "pow_solve",  # solving it (may have happened in the background before the turn)
+    "pow_wait",  # how long the turn actually waited for the pow answer
+    "ttfb",  # completion response headers arrived
+    "ttft",  # first thinking/answer text arrived
+    "total",
+)
+
+_pending_auth = None  # time ensure_auth took, charged to the next turn
+
+def record_auth(seconds):
+    """remember how long the startup credential check took"""
+    global _pending_auth
+    _pending_auth = seconds
+
+def _take_auth():
+    global _pending_auth
+    seconds, _pending_auth = _pending_auth, None
+    return seconds or 0.0
+
+class TurnStats:
+    """where one chat turn spent its time, plus how much text came back
+
+    stream deltas are roughly one token each, so tokens_per_second is deltas per
+    second after the first one arrived
+    """
+
+    __slots__ = PHASES + ("thinking_chars", "answer_chars", "deltas", "cached", "_start")
+
+    def __init__(self):
+        for phase in PHASES:
+            setattr(self, phase, None)
+        self.thinking_chars = 0
+        self.answer_chars = 0
+        self.deltas = 0
+        self.cached = False
+        self.credentials = _take_auth()
+        self._start = time.perf_counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def mark(self, phase):
+        """phase happened now (seconds since the turn started)"""
+        setattr(self, phase, self.elapsed())
+
+    @contextmanager
+    def span(self, phase):
+        """time a block, adding to whatever the phase already has"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            setattr(self, phase, (getattr(self, phase) or 0.0) + time.perf_counter() - started)
+
+    def set_pow(self, timings):
+        """(challenge_fetch, pow_solve) as measured by whoever fetched the challenge"""
+        if timings:
+            self.challenge_fetch, self.pow_solve = timings
+
+    @property
+    def tokens_per_second(self):
+        if self.total is None or self.ttft is None or self.deltas < 2:
+            return None
+        streaming = self.total - self.ttft
+        return (self.deltas - 1) / streaming if streaming > 0 else None
+
+    def _count(self, kind, text):
+        if self.ttft is None:
+            self.mark("ttft")
+        self.deltas += 1
+        if kind == THINKING:
+            self.thinking_chars += len(text)
+        else:
+            self.answer_chars += len(text)
+
+    def watch(self, deltas, on_done=None):
+        """pass (kind, text) deltas through while timing them, on_done(stats) once they end"""
+        try:
+            for kind, text in deltas:
+                self._count(kind, text)
+                yield kind, text
+        finally:
+            self.mark("total")
+            if on_done is not None:
+                on_done(self)
+
+    async def awatch(self, deltas, on_done=None):
+        """async version of watch()"""
+        try:
+            async for kind, text in deltas:
+                self._count(kind, text)
+                yield kind, text
+        finally:
+            self.mark("total")
+            if on_done is not None:
+                on_done(self)
+
+    def as_dict(self):
+        data = {phase: _round(getattr(self, phase)) for phase in PHASES}
+        data.update(
+            tokens_per_second=_round(self.tokens_per_second, 1),
+            deltas=self.deltas,
+            thinking_chars=self.thinking_chars,
+            answer_chars=self.answer_chars,
+            cached=self.cached,
+        )
+        return data
+
+    def summary(self):
+        """one line for --stats"""
+        parts = []
+        for label, phase in (("ttft", "ttft"), ("total", "total"), ("session", "session_create"),
+                             ("challenge", "challenge_fetch"), ("pow", "pow_solve"), ("pow wait", "pow_wait"),
+                             ("auth", "credentials")):
+            value = getattr(self, phase)
+            if value is not None:
+                parts.append(f"{label} {value:.2f}s")
+        if self.tokens_per_second is not None:
+            parts.append(f"{self.tokens_per_second:.1f} tok/s")
+        parts.append(f"{self.answer_chars} answer / {self.thinking_chars} thinking chars")
+        if self.cached:
+            parts.append("cached")
+        return " · ".join(parts)
+
+def _round(value, digits=4):
+    return round(value, digits) if value is not None else None
+
+class Reply(str):
+    """the answer text, with the turn's TurnStats on .stats"""
+
+    def __new__(cls, text, stats=None):
+        reply = super().__new__(cls, text or "")
+        reply.stats = stats
+        return reply
+
+class JsonlExporter:
+    """appends one json line per turn"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, stats):
+        line = json.dumps({"time": round(time.time(), 3), **stats.as_dict()})
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+class PrometheusExporter:
+    """running totals in the prometheus text format
+
+    with a path the file is rewritten after every turn (node_exporter's textfile
+    collector picks it up), the server also serves render() on /metrics
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sums = {phase: 0.0 for phase in PHASES}
+        self._counts = {phase: 0 for phase in PHASES}
+        self._turns = 0
+        self._cached = 0
+        self._chars = {"thinking": 0, "answer": 0}
+        self._deltas = 0
+
+    def record(self, stats):
+        with self._lock:
+            for phase in PHASES:
+                value = getattr(stats, phase)
+                if value is not None:
+                    self._sums[phase] += value
+                    self._counts[phase] += 1
+            self._turns += 1
+            self._cached += stats.cached
+            self._chars["thinking"] += stats.thinking_chars
+            self._chars["answer"] += stats.answer_chars
+            self._deltas += stats.deltas
+
+            if self.path:
+                tmp = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(self._render())
+                os.replace(tmp, self.path)
+
+    def render(self):
+        with self._lock:
+            return self._render()
+
+    def _render(self):
+        lines = [
+            "# HELP deepseek_turn_phase_seconds Time spent in each phase of a chat turn.",
+            "# TYPE deepseek_turn_phase_seconds summary",
+        ]
+        for phase in PHASES:
+            lines.append(f'deepseek_turn_phase_seconds_sum{{phase="{phase}"}} {self._sums[phase]:.6f}')
+            lines.append(f'deepseek_turn_phase_seconds_count{{phase="{phase}"}} {self._counts[phase]}')
+        lines += [
+            "# HELP deepseek_turns_total Chat turns finished.",
+            "# TYPE deepseek_turns_total counter",
+            f"deepseek_turns_total {self._turns}",
+            "# HELP deepseek_cached_turns_total Chat turns answered from the response cache.",
+            "# TYPE deepseek_cached_turns_total counter",
+            f"deepseek_cached_turns_total {self._cached}",
+            "# HELP deepseek_output_chars_total Characters streamed back.",
+            "# TYPE deepseek_output_chars_total counter",
+        ]
+        for kind, count in self._chars.items():
+            lines.append(f'deepseek_output_chars_total{{kind="{kind}"}} {count}')
+        lines += [
+            "# HELP deepseek_stream_deltas_total Stream deltas received (about one token each).",
+            "# TYPE deepseek_stream_deltas_total counter",
+            f"deepseek_stream_deltas_total {self._deltas}",
+        ]
+        return "\n".join(lines) + "\n"
+
+def render_session_pool(stats):
+    """SessionPool.stats() in the prometheus text format, appended to /metrics"""
+    lines = []
+    for name, help_text in (("hits", "New conversations that got a ready session."),
+                            ("misses", "New conversations that had to create a session."),
+                            ("expired", "Ready sessions thrown away for being too old."),
+                            ("failed", "Background session creations that failed.")):
+        lines += [
+            f"# HELP deepseek_session_pool_{name}_total {help_text}",
+            f"# TYPE deepseek_session_pool_{name}_total counter",
+            f"deepseek_session_pool_{name}_total {stats[name]}",
+        ]
+    lines += [
+        "# HELP deepseek_session_pool_ready Sessions waiting in the pool.",
+        "# TYPE deepseek_session_pool_ready gauge",
+        f"deepseek_session_pool_ready {stats['ready']}",
+    ]
+    return "\n".join(lines) + "\n"
+
+def render_transport(stats):
+    """Transport.stats() in the prometheus text format, appended to /metrics"""
+    lines = []
+    for name, help_text in (("retries", "Requests retried after an overload failure."),
+                            ("budget_exhausted", "Retries skipped because the retry budget was used up."),
+                            ("circuit_opens", "Times the circuit breaker opened."),
+                            ("circuit_rejected", "Requests failed fast by the open circuit breaker.")):
+        lines += [
+            f"# HELP deepseek_transport_{name}_total {help_text}",
+            f"# TYPE deepseek_transport_{name}_total counter",
+            f"deepseek_transport_{name}_total {stats[name]}",
+        ]
+    lines += [
+        "# HELP deepseek_transport_retry_budget Retries currently available.",
+        "# TYPE deepseek_transport_retry_budget gauge",
+        f"deepseek_transport_retry_budget {stats['budget_available']}",
+        "# HELP deepseek_transport_circuit_open Whether the circuit breaker is failing requests fast (1) or not (0).",
+        "# TYPE deepseek_transport_circuit_open gauge",
+        f"deepseek_transport_circuit_open {int(stats['circuit_state'] != 'closed')}",
+    ]
+    return "\n".join(lines) + "\n"
+
+class MultiExporter:
+    """hands every turn to several exporters"""
+
+    def __init__(self, exporters):
+        self.exporters = list(exporters)
+
+    def record(self, stats):
+        for exporter in self.exporters:
+            exporter.record(stats)
+
+def exporter_for(path):
+    """.prom files get the prometheus format, anything else jsonl"""
+    return PrometheusExporter(path) if path.endswith(".prom") else JsonlExporter(path)
@@ -0,0 +1,520 @@
+import os
+import time
+import ctypes
+import struct
+import random
+import hashlib
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
+from .config import Config
+
+class WasmPowSolver:
+    """keeps one compiled wasm instance around so we don't rebuild it every message"""
+
+    name = "wasm"
+
+    def __init__(self, wasm_file=None, cache_dir=None):
+        # imported here so startup doesn't pay for it, and the native solver works without it
+        try:
+            from wasmtime import Engine, Module
+        except ImportError as e:
+            raise RuntimeError("wasmtime is not installed") from e
+
+        self.config = Config()
+        self.wasm_file = wasm_file or self.config.WASM_FILE
+        self.cache_dir = cache_dir if cache_dir is not None else self.config.POW_CACHE_DIR
+        self._lock = threading.Lock()  # a store can only be used by one thread at a time
+
+        self.engine = Engine()
+        self.module = self._load_module(Module)
+        self._instantiate()
+
+    def _instantiate(self):
+        from wasmtime import Linker, Store
+
+        self.store = Store(self.engine)
+        instance = Linker(self.engine).instantiate(self.store, self.module)
+        exports = instance.exports(self.store)
+
+        self._memory = exports["memory"]
+        self._add_to_stack = exports["__wbindgen_add_to_stack_pointer"]
+        self._alloc = exports["__wbindgen_export_0"]
+        self._wasm_solve = exports["wasm_solve"]
+
+    def clone(self):
+        """a solver with its own store and instance of the same compiled module, for another thread"""
+        other = object.__new__(type(self))
+        other.config = self.config
+        other.wasm_file = self.wasm_file
+        other.cache_dir = self.cache_dir
+        other._lock = threading.Lock()
+        other.engine = self.engine
+        other.module = self.module
+        other._instantiate()
+        return other
+
+    def _cache_path(self, wasm_bytes):
+        """compiled artifacts only work for the same wasm file + wasmtime build"""
+        digest = hashlib.sha256(wasm_bytes).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"sha3_{digest}_wasmtime-{_wasmtime_version()}.cwasm")
+
+    def _load_module(self, Module):
+        """compile the wasm once, or load the precompiled version from disk"""
+        with open(self.wasm_file, "rb") as f:
+            wasm_bytes = f.read()
+
+        if not self.cache_dir:
+            return Module(self.engine, wasm_bytes)
+
+        cache_path = self._cache_path(wasm_bytes)
+        if os.path.exists(cache_path):
+            try:
+                return Module.deserialize_file(self.engine, cache_path)
+            except Exception:
+                pass  # stale or broken cache, just recompile
+
+        module = Module(self.engine, wasm_bytes)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(module.serialize())
+            os.replace(tmp_path, cache_path)  # other processes never see half a file
+        except OSError:
+            pass  # cache is optional
+
+        return module
+
+    def _base_addr(self):
+        # memory can grow and move between calls so look it up each time
+        return ctypes.cast(self._memory.data_ptr(self.store), ctypes.c_void_p).value
+
+    def _encode_string(self, text):
+        data = text.encode("utf-8")
+        ptr_val = self._alloc(self.store, len(data), 1)
+        ptr = int(ptr_val.value) if hasattr(ptr_val, "value") else int(ptr_val)
+        ctypes.memmove(self._base_addr() + ptr, data, len(data))
+        return ptr, len(data)
+
+    def solve(self, challenge_str, salt, difficulty, expire_at):
+        """find the nonce for a challenge, returns None if there isn't one"""
+        prefix = f"{salt}_{expire_at}_"
+
+        with self._lock:
+            retptr = self._add_to_stack(self.store, -16)
+            try:
+                # wasm_solve takes ownership of both strings and frees them itself
+                ptr_challenge, len_challenge = self._encode_string(challenge_str)
+                ptr_prefix, len_prefix = self._encode_string(prefix)
+
+                self._wasm_solve(self.store, retptr, ptr_challenge, len_challenge, ptr_prefix, len_prefix, float(difficulty))
+
+                base = self._base_addr()
+                status = struct.unpack("<i", ctypes.string_at(base + retptr, 4))[0]
+                value = struct.unpack("<d", ctypes.string_at(base + retptr + 8, 8))[0]
+            finally:
+                self._add_to_stack(self.store, 16)
+
+        return int(value) if status != 0 else None
+
+# DeepSeekHashV1 is sha3-256 with the first keccak round skipped, so hashlib
+# can't do it directly. instead we pack one 64-bit lane per nonce into a big
+# python int and run the permutation on all of them at once (bit slicing)
+_ROUND_CONSTANTS = [
+    0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+]
+_RATE = 136  # sha3-256 block size in bytes
+_LANE_MASK = (1 << 64) - 1
+
+@lru_cache(maxsize=8)
+def _batch_constants(count):
+    """masks and round constants repeated across `count` packed lanes"""
+    repeat = int.from_bytes(b"\x01\x00\x00\x00\x00\x00\x00\x00" * count, "little")
+    ones = _LANE_MASK * repeat
+    low = [((1 << n) - 1) * repeat for n in range(64)]
+    high = [(_LANE_MASK ^ ((1 << n) - 1)) * repeat for n in range(64)]
+    round_constants = [rc * repeat for rc in _ROUND_CONSTANTS]
+    return repeat, ones, low, high, round_constants
+
+def _pack(values):
+    return int.from_bytes(struct.pack(f"<{len(values)}Q", *values), "little")
+
+def _keccak_batch(
+    a00, a10, a20, a30, a40,
+    a01, a11, a21, a31, a41,
+    a02, a12, a22, a32, a42,
+    a03, a13, a23, a33, a43,
+    a04, a14, a24, a34, a44,
+    ones, low, high, round_constants,
+):
+    """keccak-f[1600] over packed lanes, returns the 4 lanes of the digest"""
+    for rc in round_constants:
+        # theta
+        c0 = a00 ^ a01 ^ a02 ^ a03 ^ a04
+        c1 = a10 ^ a11 ^ a12 ^ a13 ^ a14
+        c2 = a20 ^ a21 ^ a22 ^ a23 ^ a24
+        c3 = a30 ^ a31 ^ a32 ^ a33 ^ a34
+        c4 = a40 ^ a41 ^ a42 ^ a43 ^ a44
+        d0 = c4 ^ ((c1 << 1) & high[1]) ^ ((c1 >> 63) & low[1])
+        d1 = c0 ^ ((c2 << 1) & high[1]) ^ ((c2 >> 63) & low[1])
+        d2 = c1 ^ ((c3 << 1) & high[1]) ^ ((c3 >> 63) & low[1])
+        d3 = c2 ^ ((c4 << 1) & high[1]) ^ ((c4 >> 63) & low[1])
+        d4 = c3 ^ ((c0 << 1) & high[1]) ^ ((c0 >> 63) & low[1])
+        # rho + pi
+        b00 = a00 ^ d0
+        t = a01 ^ d0; b13 = ((t << 36) & high[36]) | ((t >> 28) & low[36])
+        t = a02 ^ d0; b21 = ((t << 3) & high[3]) | ((t >> 61) & low[3])
+        t = a03 ^ d0; b34 = ((t << 41) & high[41]) | ((t >> 23) & low[41])
+        t = a04 ^ d0; b42 = ((t << 18) & high[18]) | ((t >> 46) & low[18])
+        t = a10 ^ d1; b02 = ((t << 1) & high[1]) | ((t >> 63) & low[1])
+        t = a11 ^ d1; b10 = ((t << 44) & high[44]) | ((t >> 20) & low[44])
+        t = a12 ^ d1; b23 = ((t << 10) & high[10]) | ((t >> 54) & low[10])
+        t = a13 ^ d1; b31 = ((t << 45) & high[45]) | ((t >> 19) & low[45])
+        t = a14 ^ d1; b44 = ((t << 2) & high[2]) | ((t >> 62) & low[2])
+        t = a20 ^ d2; b04 = ((t << 62) & high[62]) | ((t >> 2) & low[62])
+        t = a21 ^ d2; b12 = ((t << 6) & high[6]) | ((t >> 58) & low[6])
+        t = a22 ^ d2; b20 = ((t << 43) & high[43]) | ((t >> 21) & low[43])
+        t = a23 ^ d2; b33 = ((t << 15) & high[15]) | ((t >> 49) & low[15])
+        t = a24 ^ d2; b41 = ((t << 61) & high[61]) | ((t >> 3) & low[61])
+        t = a30 ^ d3; b01 = ((t << 28) & high[28]) | ((t >> 36) & low[28])
+        t = a31 ^ d3; b14 = ((t << 55) & high[55]) | ((t >> 9) & low[55])
+        t = a32 ^ d3; b22 = ((t << 25) & high[25]) | ((t >> 39) & low[25])
+        t = a33 ^ d3; b30 = ((t << 21) & high[21]) | ((t >> 43) & low[21])
+        t = a34 ^ d3; b43 = ((t << 56) & high[56]) | ((t >> 8) & low[56])
+        t = a40 ^ d4; b03 = ((t << 27) & high[27]) | ((t >> 37) & low[27])
+        t = a41 ^ d4; b11 = ((t << 20) & high[20]) | ((t >> 44) & low[20])
+        t = a42 ^ d4; b24 = ((t << 39) & high[39]) | ((t >> 25) & low[39])
+        t = a43 ^ d4; b32 = ((t << 8) & high[8]) | ((t >> 56) & low[8])
+        t = a44 ^ d4; b40 = ((t << 14) & high[14]) | ((t >> 50) & low[14])
+        # chi + iota
+        a00 = b00 ^ ((b10 ^ ones) & b20)
+        a10 = b10 ^ ((b20 ^ ones) & b30)
+        a20 = b20 ^ ((b30 ^ ones) & b40)
+        a30 = b30 ^ ((b40 ^ ones) & b00)
+        a40 = b40 ^ ((b00 ^ ones) & b10)
+        a01 = b01 ^ ((b11 ^ ones) & b21)
+        a11 = b11 ^ ((b21 ^ ones) & b31)
+        a21 = b21 ^ ((b31 ^ ones) & b41)
+        a31 = b31 ^ ((b41 ^ ones) & b01)
+        a41 = b41 ^ ((b01 ^ ones) & b11)
+        a02 = b02 ^ ((b12 ^ ones) & b22)
+        a12 = b12 ^ ((b22 ^ ones) & b32)
+        a22 = b22 ^ ((b32 ^ ones) & b42)
+        a32 = b32 ^ ((b42 ^ ones) & b02)
+        a42 = b42 ^ ((b02 ^ ones) & b12)
+        a03 = b03 ^ ((b13 ^ ones) & b23)
+        a13 = b13 ^ ((b23 ^ ones) & b33)
+        a23 = b23 ^ ((b33 ^ ones) & b43)
+        a33 = b33 ^ ((b43 ^ ones) & b03)
+        a43 = b43 ^ ((b03 ^ ones) & b13)
+        a04 = b04 ^ ((b14 ^ ones) & b24)
+        a14 = b14 ^ ((b24 ^ ones) & b34)
+        a24 = b24 ^ ((b34 ^ ones) & b44)
+        a34 = b34 ^ ((b44 ^ ones) & b04)
+        a44 = b44 ^ ((b04 ^ ones) & b14)
+        a00 ^= rc
+    return a00, a10, a20, a30
+
+
+def deepseek_hash_v1(data):
+    """hex digest of a single-block message, mostly for making test challenges"""
+    if len(data) >= _RATE:
+        raise ValueError("message too long for one block")
+    block = bytearray(_RATE)
+    block[:len(data)] = data
+    block[len(data)] = 0x06
+    block[-1] |= 0x80
+    lanes = struct.unpack("<17Q", block) + (0,) * 8
+    _, ones, low, high, round_constants = _batch_constants(1)
+    return struct.pack("<4Q", *_keccak_batch(*lanes, ones, low, high, round_constants)).hex()
+
+class NativePowSolver:
+    """pure python solver, slower than wasm but needs no runtime at all"""
+
+    name = "native"
+
+    def __init__(self, batch_size=None):
+        self.config = Config()
+        self.batch_size = batch_size or self.config.POW_BATCH_SIZE
+
+    def clone(self):
+        return NativePowSolver(self.batch_size)
+
+    def solve(self, challenge_str, salt, difficulty, expire_at):
+        """find the nonce for a challenge, returns None if there isn't one"""
+        prefix = f"{salt}_{expire_at}_".encode()
+        target = struct.unpack("<4Q", bytes.fromhex(challenge_str))
+        difficulty = int(difficulty)
+
+        # nonces with the same number of digits share the same block layout
+        digits = 1
+        while 10 ** (digits - 1) < difficulty or digits == 1:
+            start = 0 if digits == 1 else 10 ** (digits - 1)
+            end = min(10 ** digits, difficulty)
+            answer = self._solve_range(prefix, digits, start, end, target)
+            if answer is not None:
+                return answer
+            digits += 1
+
+        return None
+
+    def _solve_range(self, prefix, digits, start, end, target):
+        msg_len = len(prefix) + digits
+        if msg_len >= _RATE:
+            return None  # never happens with real challenges
+
+        block = bytearray(_RATE)
+        block[:len(prefix)] = prefix
+        block[msg_len] = 0x06
+        block[-1] |= 0x80
+
+        # only the lanes holding the nonce change, everything else is constant
+        first = len(prefix) // 8
+        last = msg_len // 8
+        lane_fmt = f"<{last - first + 1}Q"
+        offset = first * 8
+        base_lanes = list(struct.unpack("<17Q", block)) + [0] * 8
+
+        for batch_start in range(start, end, self.batch_size):
+            nonces = range(batch_start, min(batch_start + self.batch_size, end))
+            repeat, ones, low, high, round_constants = _batch_constants(len(nonces))
+
+            rows = []
+            for nonce in nonces:
+                block[len(prefix):msg_len] = b"%d" % nonce
+                rows.append(struct.unpack_from(lane_fmt, block, offset))
+
+            lanes = [lane * repeat for lane in base_lanes]
+            for i, column in enumerate(zip(*rows)):
+                lanes[first + i] = _pack(column)
+
+            out = _keccak_batch(*lanes, ones, low, high, round_constants)
+            diff = 0
+            for lane, want in zip(out, target):
+                diff |= lane ^ (want * repeat)
+
+            index = _find_zero_lane(diff, len(nonces))
+            if index is not None:
+                return batch_start + index
+
+        return None
+
+def _find_zero_lane(value, count):
+    """index of the first all-zero 64-bit lane, i.e. the nonce that matched"""
+    raw = value.to_bytes(count * 8, "little")
+    pos = raw.find(_ZERO_LANE)
+    while pos != -1:
+        if pos % 8 == 0:
+            return pos // 8
+        pos = raw.find(_ZERO_LANE, pos + 1)
+    return None
+
+_ZERO_LANE = bytes(8)
+
+_BACKENDS = {"wasm": WasmPowSolver, "native": NativePowSolver}
+
+def benchmark_backends(answer=None, difficulty=144000):
+    """time every backend we can load on the same challenge, returns {name: (solver, seconds)}"""
+    answer = random.randrange(difficulty) if answer is None else answer
+    salt = "%016x" % random.getrandbits(64)
+    expire_at = int(time.time() * 1000)
+    challenge = deepseek_hash_v1(f"{salt}_{expire_at}_{answer}".encode())
+
+    results = {}
+    for name, backend in _BACKENDS.items():
+        try:
+            solver = backend()
+        except Exception as e:
+            if not isinstance(e.__cause__, ImportError):
+                # installed but broken (missing wasm file, bad cache entry), say so instead of quietly going slow
+                Config.print_status(f"{name} proof of work backend failed to load: {e}", "yellow")
+            continue
+        start = time.perf_counter()
+        got = solver.solve(challenge, salt, difficulty, expire_at)
+        elapsed = time.perf_counter() - start
+        if got != answer:
+            raise RuntimeError(f"{name} solver returned {got}, expected {answer}")
+        results[name] = (solver, elapsed)
+
+    return results
+
+def select_backend():
+    """pick the fastest backend on this machine, checking they all agree first"""
+    results = benchmark_backends(answer=Config.POW_BENCH_ANSWER)
+    if not results:
+        raise RuntimeError("No proof of work backend available")
+    name = min(results, key=lambda n: results[n][1])
+    return results[name][0]
+
+def _wasmtime_version():
+    try:
+        from importlib.metadata import version
+        return version("wasmtime")
+    except Exception:
+        return "unknown"
+
+_solver = None
+_solver_lock = threading.Lock()
+
+def get_solver():
+    """shared solver for the whole process, built on first use"""
+    global _solver
+    if _solver is None:
+        with _solver_lock:
+            if _solver is None:
+                backend = Config.POW_BACKEND
+                _solver = select_backend() if backend == "auto" else _BACKENDS[backend]()
+    return _solver
+
+class PowExecutor:
+    """where solves run: submit() returns a concurrent.futures.Future of the answer
+
+    solving is pure cpu work, so an executor keeps it off the event loop and the
+    request threads, and the thread and process ones run several at once
+    """
+
+    name = None
+
+    def submit(self, challenge_str, salt, difficulty, expire_at):
+        raise NotImplementedError
+
+    def solve(self, challenge_str, salt, difficulty, expire_at):
+        """blocking solve"""
+        return self.submit(challenge_str, salt, difficulty, expire_at).result()
+
+    async def solve_async(self, challenge_str, salt, difficulty, expire_at):
+        """solve without blocking the event loop"""
+        import asyncio
+        return await asyncio.wrap_future(self.submit(challenge_str, salt, difficulty, expire_at))
+
+    def warm(self):
+        """start every worker (and build its solver) now instead of on the first challenge"""
+
+    def shutdown(self, wait=True):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+class InlineExecutor(PowExecutor):
+    """solves in the calling thread, for one-off prompts where a pool is pure overhead"""
+
+    name = "inline"
+
+    def __init__(self, solver=None):
+        self.solver = solver or get_solver()
+
+    def submit(self, challenge_str, salt, difficulty, expire_at):
+        future = Future()
+        try:
+            future.set_result(self.solver.solve(challenge_str, salt, difficulty, expire_at))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+class ThreadExecutor(PowExecutor):
+    """a thread pool where every worker owns a clone of the solver
+
+    wasmtime releases the gil while wasm runs, so wasm solves really do run in
+    parallel, and no worker ever waits on another's store lock
+    """
+
+    name = "thread"
+
+    def __init__(self, workers=None, solver=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.workers = workers or Config.POW_WORKERS or os.cpu_count() or 1
+        self._template = solver or get_solver()
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="pow", initializer=self._init_worker)
+
+    def _init_worker(self):
+        self._local.solver = self._template.clone()
+
+    def _solve(self, challenge_str, salt, difficulty, expire_at):
+        return self._local.solver.solve(challenge_str, salt, difficulty, expire_at)
+
+    def submit(self, challenge_str, salt, difficulty, expire_at):
+        return self._pool.submit(self._solve, challenge_str, salt, difficulty, expire_at)
+
+    def warm(self):
+        # the pool only starts a thread when no idle one is around, so keep them all busy at once
+        barrier = threading.Barrier(self.workers)
+        for future in [self._pool.submit(barrier.wait) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+_process_solver = None  # the solver of a ProcessExecutor worker
+
+def _init_process_worker(backend, wasm_file, cache_dir, batch_size):
+    global _process_solver
+    Config.WASM_FILE, Config.POW_CACHE_DIR, Config.POW_BATCH_SIZE = wasm_file, cache_dir, batch_size
+    _process_solver = _BACKENDS[backend]()
+
+def _solve_in_process(challenge_str, salt, difficulty, expire_at):
+    return _process_solver.solve(challenge_str, salt, difficulty, expire_at)
+
+def _process_ready():
+    return os.getpid()
+
+class ProcessExecutor(PowExecutor):
+    """a process pool with one solver per worker, for when the gil is the bottleneck (the native solver)"""
+
+    name = "process"
+
+    def __init__(self, workers=None, backend=None):
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.workers = workers or Config.POW_WORKERS or os.cpu_count() or 1
+        if backend is None:
+            backend = Config.POW_BACKEND if Config.POW_BACKEND != "auto" else get_solver().name
+        self.backend = backend
+        self._pool = ProcessPoolExecutor(
+            self.workers,
+            initializer=_init_process_worker,
+            initargs=(backend, Config.WASM_FILE, Config.POW_CACHE_DIR, Config.POW_BATCH_SIZE),
+        )
+
+    def submit(self, challenge_str, salt, difficulty, expire_at):
+        return self._pool.submit(_solve_in_process, challenge_str, salt, difficulty, expire_at)
+
+    def warm(self):
+        for future in [self._pool.submit(_process_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+_EXECUTORS = {"inline": InlineExecutor, "thread": ThreadExecutor, "process": ProcessExecutor}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """shared pow executor for the whole process, built on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                kind = Config.POW_EXECUTOR
+                if kind == "auto":
+                    # wasm runs without the gil, the native solver needs processes to scale
+                    kind = "thread" if get_solver().name == "wasm" else "process"
+                _executor = _EXECUTORS[kind]()
+    return _executor
+
+if __name__ == "__main__":
+    for name, (_, seconds) in benchmark_backends().items():
+        Config.print_status(f"{name}: {seconds * 1000:.1f} ms", "cyan")
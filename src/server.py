@@ -0,0 +1,228 @@
+import json
+import time
+import uuid
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from .config import Config
+from .client import DeepSeekError
+from .async_client import AsyncDeepSeekClient
+from .metrics import MultiExporter, PrometheusExporter, exporter_for, render_session_pool, render_transport
+from .pow import get_executor
+from .sessions import SessionPool
+from .stream import ANSWER
+
+MODELS = {
+    "deepseek-chat": False,  # model name -> deep thinking on/off
+    "deepseek-reasoner": True,
+}
+
+class ConversationMap:
+    """remembers which deepseek session + parent message continues a given history
+
+    openai clients resend the whole history every time, we look up the history
+    minus the new user message and only send that message to the same session
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or Config.SERVER_MAX_CONVERSATIONS
+        self._items = OrderedDict()
+
+    @staticmethod
+    def key(messages):
+        history = [(m.get("role"), message_text(m.get("content"))) for m in messages]
+        return hashlib.sha256(json.dumps(history, ensure_ascii=False).encode()).hexdigest()
+
+    def get(self, messages):
+        key = self.key(messages)
+        found = self._items.get(key)
+        if found is not None:
+            self._items.move_to_end(key)
+        return found
+
+    def put(self, messages, session_id, parent_message_id):
+        key = self.key(messages)
+        self._items[key] = (session_id, parent_message_id)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+def message_text(content):
+    """openai content is either a string or a list of parts"""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+def build_prompt(messages):
+    """flatten a history we can't continue into one prompt"""
+    if len(messages) == 1:
+        return message_text(messages[0].get("content"))
+    lines = [f"{m.get('role', 'user').capitalize()}: {message_text(m.get('content'))}" for m in messages]
+    return "\n\n".join(lines)
+
+def check_messages(messages):
+    """why messages isn't a usable openai history, None if it is"""
+    if not isinstance(messages, list) or not messages:
+        return "messages must be a non-empty list"
+    for i, m in enumerate(messages):
+        if not isinstance(m, dict):
+            return f"messages[{i}] must be an object"
+        content = m.get("content")
+        if content is not None and not isinstance(content, (str, list)):
+            return f"messages[{i}].content must be a string or a list of parts"
+    if messages[-1].get("role") != "user":
+        return "The last message must be from the user"
+    return None
+
+def error_response(status, message, kind="invalid_request_error", retry_after=None):
+    # pass deepseek's (or our circuit breaker's) Retry-After on, so clients back off too
+    headers = {"Retry-After": str(max(1, round(retry_after)))} if retry_after is not None else None
+    return JSONResponse({"error": {"message": message, "type": kind}}, status_code=status, headers=headers)
+
+def create_app(metrics_out=None):
+    """the app keeps credentials, the pow solver and the connection pool warm"""
+    state = {}
+    # /metrics always works, metrics_out additionally writes every turn to a file
+    metrics = PrometheusExporter()
+    exporter = MultiExporter([metrics, exporter_for(metrics_out)] if metrics_out else [metrics])
+    sessions = SessionPool()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        client = AsyncDeepSeekClient()
+        client.metrics = exporter
+        client.session_pool = sessions
+        state["client"] = client  # every request gets its own conversation on it
+        client.credentials.start_background_refresh()  # log in again before the token lapses
+        state["conversations"] = ConversationMap()
+        get_executor().warm()  # compile the wasm and start the solver workers now, not on the first request
+        client.fill_sessions()  # new conversations start on a ready session
+        try:
+            yield
+        finally:
+            await client.aclose()
+
+    app = FastAPI(title="DeepSeek reverse API", lifespan=lifespan)
+
+    @app.get("/metrics")
+    async def prometheus_metrics():
+        text = metrics.render() + render_session_pool(sessions.stats()) + render_transport(state["client"].transport.stats())
+        return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": name, "object": "model", "owned_by": "deepseek"} for name in MODELS]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        try:
+            body = await request.json()
+        except ValueError:
+            return error_response(400, "Body must be JSON")
+        if not isinstance(body, dict):
+            return error_response(400, "Body must be a JSON object")
+
+        messages = body.get("messages")
+        problem = check_messages(messages)
+        if problem:
+            return error_response(400, problem)
+
+        model = body.get("model") or "deepseek-chat"
+        thinking = bool(body.get("thinking", MODELS.get(model, False)))
+        search = bool(body.get("search", False))
+
+        client = state["client"].conversation()
+        conversations = state["conversations"]
+
+        found = conversations.get(messages[:-1]) if len(messages) > 1 else None
+        if found:
+            client.session_id, client.parent_message_id = found
+            prompt = message_text(messages[-1].get("content"))
+        else:
+            prompt = build_prompt(messages)
+
+        deltas = client.stream(prompt, thinking=thinking, search=search)
+
+        # get the first delta before answering so errors become proper status codes
+        try:
+            first = await deltas.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except DeepSeekError as e:
+            return error_response(e.status or 502, str(e), "upstream_error", e.retry_after)
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        answer = []
+
+        def remember():
+            history = messages + [{"role": "assistant", "content": "".join(answer)}]
+            if client.session_id and client.parent_message_id:
+                conversations.put(history, client.session_id, client.parent_message_id)
+
+        async def all_deltas():
+            if first is not None:
+                yield first
+            async for delta in deltas:
+                yield delta
+
+        if not body.get("stream"):
+            reasoning = []
+            try:
+                async for kind, text in all_deltas():
+                    (answer if kind == ANSWER else reasoning).append(text)
+            except DeepSeekError as e:
+                return error_response(e.status or 502, str(e), "upstream_error", e.retry_after)
+            remember()
+
+            message = {"role": "assistant", "content": "".join(answer)}
+            if reasoning:
+                message["reasoning_content"] = "".join(reasoning)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            }
+
+        def chunk(delta, finish_reason=None):
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        async def event_stream():
+            yield chunk({"role": "assistant", "content": ""})
+            try:
+                async for kind, text in all_deltas():
+                    if kind == ANSWER:
+                        answer.append(text)
+                        yield chunk({"content": text})
+                    else:
+                        yield chunk({"reasoning_content": text})
+            except DeepSeekError as e:
+                yield f"data: {json.dumps({'error': {'message': str(e), 'type': 'upstream_error'}})}\n\n"
+                return
+            remember()
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return app
+
+def serve(host=None, port=None, metrics_out=None):
+    """run the server until ctrl-c"""
+    import uvicorn
+
+    host = host or Config.SERVER_HOST
+    port = port or Config.SERVER_PORT
+    Config.print_status(f"Serving OpenAI-compatible API on http://{host}:{port}/v1", "green")
+    uvicorn.run(create_app(metrics_out), host=host, port=port, log_level="warning")
@@ -0,0 +1,69 @@
+import time
+import threading
+from collections import deque
+from .config import Config
+
+class SessionPool:
+    """chat sessions created ahead of time, so a new conversation skips chat_session/create
+
+    the clients do the actual requests (take() + fill_sessions(), and again when a
+    pooled session expires), this only keeps the bookkeeping. it stays small and
+    drops sessions older than max_age, so it never sits on more than `size` unused
+    sessions for long
+    """
+
+    def __init__(self, size=None, max_age=None):
+        self.size = Config.SESSION_POOL_SIZE if size is None else size
+        self.max_age = max_age or Config.SESSION_POOL_MAX_AGE
+        self._ready = deque()  # (session_id, created), oldest first
+        self._pending = 0  # creations in flight
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.failed = 0
+
+    def take(self):
+        """a ready session id, or None if there isn't a fresh one (counted as a hit or a miss)"""
+        now = time.monotonic()
+        with self._lock:
+            while self._ready:
+                session_id, created = self._ready.popleft()
+                if now - created < self.max_age:
+                    self.hits += 1
+                    return session_id
+                self.expired += 1
+            self.misses += 1
+            return None
+
+    def reserve(self):
+        """how many sessions to create now to fill the pool, they count as pending until add()"""
+        now = time.monotonic()
+        with self._lock:
+            while self._ready and now - self._ready[0][1] >= self.max_age:
+                self._ready.popleft()
+                self.expired += 1
+            wanted = max(0, self.size - len(self._ready) - self._pending)
+            self._pending += wanted
+            return wanted
+
+    def add(self, session_id):
+        """a reserved creation finished, session_id is None if it failed"""
+        with self._lock:
+            self._pending -= 1
+            if session_id:
+                self._ready.append((session_id, time.monotonic()))
+            else:
+                self.failed += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "failed": self.failed,
+                "ready": len(self._ready),
+            }
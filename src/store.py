@@ -0,0 +1,183 @@
+import os
+import time
+import sqlite3
+import threading
+from .config import Config
+from .stream import THINKING
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT UNIQUE NOT NULL,
+    title TEXT,
+    created REAL,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    conversation_id INTEGER NOT NULL REFERENCES conversations(id),
+    parent_message_id INTEGER,
+    message_id INTEGER,
+    prompt TEXT NOT NULL,
+    thinking TEXT NOT NULL DEFAULT '',
+    answer TEXT NOT NULL DEFAULT '',
+    created REAL,
+    finished INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS turns_by_conversation ON turns(conversation_id, id);
+"""
+
+# external content fts table, kept in sync by triggers so we never write text twice by hand
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(prompt, answer, content='turns', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS turns_ai AFTER INSERT ON turns BEGIN
+    INSERT INTO turns_fts(rowid, prompt, answer) VALUES (new.id, new.prompt, new.answer);
+END;
+CREATE TRIGGER IF NOT EXISTS turns_ad AFTER DELETE ON turns BEGIN
+    INSERT INTO turns_fts(turns_fts, rowid, prompt, answer) VALUES ('delete', old.id, old.prompt, old.answer);
+END;
+CREATE TRIGGER IF NOT EXISTS turns_au AFTER UPDATE OF prompt, answer ON turns BEGIN
+    INSERT INTO turns_fts(turns_fts, rowid, prompt, answer) VALUES ('delete', old.id, old.prompt, old.answer);
+    INSERT INTO turns_fts(rowid, prompt, answer) VALUES (new.id, new.prompt, new.answer);
+END;
+"""
+
+class ConversationStore:
+    """sqlite file with every session, message id and transcript we've seen
+
+    lets a new process continue an old chat (same deepseek session, right parent
+    message) without creating a session first, and search old transcripts
+    """
+
+    def __init__(self, path=None):
+        self.path = path or Config.CONVERSATIONS_DB
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # the sync client streams on the main thread but prefetches on a worker, so share one locked connection
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")  # readers don't block the streaming writer
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            try:
+                self._db.executescript(FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                self.has_fts = False  # sqlite built without fts5, search falls back to LIKE
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def conversation(self, session_id, title=None):
+        """id of the conversation for a deepseek session, created on first use"""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR IGNORE INTO conversations (session_id, title, created, updated) VALUES (?, ?, ?, ?)",
+                (session_id, (title or "")[:Config.CONVERSATION_TITLE_LENGTH], now, now),
+            )
+            row = self._db.execute("SELECT id FROM conversations WHERE session_id = ?", (session_id,)).fetchone()
+        return row["id"]
+
+    def start_turn(self, conversation_id, prompt, parent_message_id=None):
+        """record a prompt before the answer arrives, returns a Turn to stream into"""
+        now = time.time()
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO turns (conversation_id, parent_message_id, prompt, created) VALUES (?, ?, ?, ?)",
+                (conversation_id, parent_message_id, prompt, now),
+            )
+            self._db.execute("UPDATE conversations SET updated = ? WHERE id = ?", (now, conversation_id))
+        return Turn(self, cursor.lastrowid)
+
+    def _save_turn(self, turn_id, thinking, answer, message_id=None, finished=False):
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE turns SET thinking = ?, answer = ?, message_id = COALESCE(?, message_id), finished = ? WHERE id = ?",
+                (thinking, answer, message_id, int(finished), turn_id),
+            )
+
+    def resume(self, conversation_id=None):
+        """(conversation_id, session_id, parent_message_id) to continue, the latest one if no id given"""
+        with self._lock:
+            if conversation_id is None:
+                row = self._db.execute("SELECT id, session_id FROM conversations ORDER BY updated DESC LIMIT 1").fetchone()
+            else:
+                row = self._db.execute("SELECT id, session_id FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+            if row is None:
+                return None
+            # the last reply deepseek gave an id to is what the next message continues from
+            last = self._db.execute(
+                "SELECT message_id FROM turns WHERE conversation_id = ? AND message_id IS NOT NULL "
+                "ORDER BY id DESC LIMIT 1",
+                (row["id"],),
+            ).fetchone()
+        return row["id"], row["session_id"], last["message_id"] if last else None
+
+    def recent(self, limit=20):
+        """newest conversations first"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT c.id, c.title, c.updated, COUNT(t.id) AS turns FROM conversations c "
+                "LEFT JOIN turns t ON t.conversation_id = c.id GROUP BY c.id ORDER BY c.updated DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+
+    def search(self, query, limit=20):
+        """full text search over prompts and answers, best matches first"""
+        with self._lock:
+            if self.has_fts:
+                return self._db.execute(
+                    "SELECT t.conversation_id, c.title, t.created, "
+                    "snippet(turns_fts, -1, '[', ']', '...', 12) AS snippet "
+                    "FROM turns_fts JOIN turns t ON t.id = turns_fts.rowid "
+                    "JOIN conversations c ON c.id = t.conversation_id "
+                    "WHERE turns_fts MATCH ? ORDER BY rank LIMIT ?",
+                    (fts_query(query), limit),
+                ).fetchall()
+            pattern = f"%{query}%"
+            return self._db.execute(
+                "SELECT t.conversation_id, c.title, t.created, substr(t.answer, 1, 80) AS snippet "
+                "FROM turns t JOIN conversations c ON c.id = t.conversation_id "
+                "WHERE t.prompt LIKE ? OR t.answer LIKE ? ORDER BY t.id DESC LIMIT ?",
+                (pattern, pattern, limit),
+            ).fetchall()
+
+    def transcript(self, conversation_id):
+        """every turn of a conversation in order"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT prompt, thinking, answer, message_id, finished FROM turns WHERE conversation_id = ? ORDER BY id",
+                (conversation_id,),
+            ).fetchall()
+
+def fts_query(text):
+    """quote every word so user input can't break the fts syntax"""
+    words = text.split()
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words) or '""'
+
+class Turn:
+    """one prompt + answer being streamed, written to disk every so often instead of per delta"""
+
+    def __init__(self, store, turn_id):
+        self.store = store
+        self.turn_id = turn_id
+        self.thinking = []
+        self.answer = []
+        self._last_flush = time.monotonic()
+
+    def add(self, kind, text):
+        (self.thinking if kind == THINKING else self.answer).append(text)
+        if time.monotonic() - self._last_flush >= Config.CONVERSATION_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self, message_id=None, finished=False):
+        self._last_flush = time.monotonic()
+        self.store._save_turn(self.turn_id, "".join(self.thinking), "".join(self.answer), message_id, finished)
+
+    def finish(self, message_id=None, finished=True):
+        """final write, finished=False keeps track of answers that got cut off"""
+        self.flush(message_id, finished)
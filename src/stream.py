@@ -0,0 +1,125 @@
+import json
+from json.decoder import scanstring
+
+THINKING = "thinking"
+ANSWER = "answer"
+
+_FAST_PREFIX = '{"v":"'
+
+class StreamDecoder:
+    """incremental decoder for the completion sse stream
+
+    deepseek sends json patches: {"p": path, "v": value}, and later chunks with
+    only {"v": "..."} keep appending to the last path. most chunks are that short
+    form so we decode them without going through json.loads.
+    """
+
+    def __init__(self):
+        self.path = ""
+        self.response_message_id = None
+        self.finished = False
+        self._buffer = b""
+        self._thinking = []
+        self._answer = []
+
+    @property
+    def thinking_content(self):
+        return "".join(self._thinking)
+
+    @property
+    def main_content(self):
+        return "".join(self._answer)
+
+    def feed(self, data):
+        """take raw bytes from the socket, returns a list of (kind, text) deltas"""
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()  # last piece might be half a line
+
+        deltas = []
+        for line in lines:
+            delta = self._decode_line(line)
+            if delta is not None:
+                deltas.append(delta)
+        return deltas
+
+    def close(self):
+        """flush whatever is left once the stream ends"""
+        line, self._buffer = self._buffer, b""
+        delta = self._decode_line(line) if line else None
+        return [delta] if delta is not None else []
+
+    def iter_chunks(self, chunks):
+        """decode an iterable of byte chunks, e.g. resp.iter_content()
+
+        stops right after the FINISHED status instead of waiting for the server
+        to end the body, whatever is left stays unread in `chunks`
+        """
+        for data in chunks:
+            yield from self.feed(data)
+            if self.finished:
+                return
+        yield from self.close()
+
+    def _decode_line(self, line):
+        if not line.startswith(b"data:"):
+            return None  # blank lines, event: lines, comments
+
+        text = line[5:].decode("utf-8", errors="ignore").strip()
+        if not text or text == "{}":
+            return None
+
+        # fast path: {"v":"some text"} appending to the current path
+        if text.startswith(_FAST_PREFIX):
+            try:
+                value, end = scanstring(text, len(_FAST_PREFIX))
+            except ValueError:
+                value, end = None, 0
+            if text[end:] == "}":
+                return self._append(value)
+
+        try:
+            chunk = json.loads(text)
+        except ValueError:
+            return None
+        if not isinstance(chunk, dict):
+            return None
+
+        if "response_message_id" in chunk:
+            self.response_message_id = chunk["response_message_id"]
+
+        if "p" in chunk:
+            self.path = chunk["p"]
+
+        value = chunk.get("v")
+        if isinstance(value, str):
+            if self.path.endswith("status"):
+                self._set_status(value)
+                return None
+            return self._append(value)
+
+        if isinstance(value, dict):
+            response = value.get("response")
+            if isinstance(response, dict) and "message_id" in response:
+                self.response_message_id = response["message_id"]
+        elif isinstance(value, list):
+            # batched patches, we only care about the final status
+            for item in value:
+                if isinstance(item, dict) and item.get("p") == "status":
+                    self._set_status(item.get("v"))
+
+        return None
+
+    def _set_status(self, status):
+        if status == "FINISHED":
+            self.finished = True
+
+    def _append(self, value):
+        if not value:
+            return None
+        if "thinking" in self.path:
+            self._thinking.append(value)
+            return THINKING, value
+        if not self.path or self.path.endswith("content"):
+            self._answer.append(value)
+            return ANSWER, value
+        return None  # other fields like search status, not text
@@ -0,0 +1,263 @@
+import time
+import random
+import threading
+from .config import Config
+
+class DeepSeekError(RuntimeError):
+    """a request the api refused, with whatever it told us about why"""
+
+    def __init__(self, message, status=None, code=None, retry_after=None):
+        super().__init__(message)
+        self.status = status  # http status, None when we never got one (network, pow)
+        self.code = code  # deepseek's own "code" field
+        self.retry_after = retry_after  # seconds, from the Retry-After header
+
+    @property
+    def retryable(self):
+        """rate limits, server hiccups and expired logins (refreshed in the background) are worth another try"""
+        return self.status is None or self.status in (401, 429) or self.status >= 500
+
+    @property
+    def overload(self):
+        """the api (or the way to it) is struggling: retried right away and counted by the circuit breaker
+
+        a 401 isn't, the new login it needs takes longer than any backoff
+        """
+        return self.status is None or self.status == 429 or self.status >= 500
+
+class CircuitOpenError(DeepSeekError):
+    """the circuit breaker is open, the request wasn't sent at all"""
+
+def parse_retry_after(value):
+    """Retry-After in seconds (we don't bother with the http-date form)"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, retry_after=None, base=None, cap=None):
+    """server's Retry-After if it sent one, otherwise jittered exponential backoff"""
+    if retry_after is not None:
+        return retry_after
+    base = Config.RETRY_BACKOFF_BASE if base is None else base
+    cap = Config.RETRY_BACKOFF_MAX if cap is None else cap
+    delay = min(cap, base * (2 ** attempt))
+    return random.uniform(delay / 2, delay)
+
+class RetryBudget:
+    """retries have to be paid for by requests, so an outage can't multiply our traffic
+
+    every request earns `ratio` of a retry and every retry spends a whole one, with
+    at most `burst` saved up. while the api is healthy that's plenty, when every
+    request fails the savings are gone after a few retries and failures come back
+    right away instead of piling up
+    """
+
+    def __init__(self, ratio=None, burst=None):
+        self.ratio = Config.RETRY_BUDGET_RATIO if ratio is None else ratio
+        self.burst = Config.RETRY_BUDGET_BURST if burst is None else burst
+        self._tokens = float(self.burst)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def withdraw(self):
+        """take one retry, False if the budget is used up"""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def available(self):
+        return int(self._tokens)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """stop calling the api for a while after `threshold` overload failures in a row
+
+    once reset_timeout has passed a single probe request goes out: if it works
+    we're closed again, if not the breaker stays open for another reset_timeout.
+    meanwhile requests fail fast with a CircuitOpenError carrying a retry_after
+    """
+
+    def __init__(self, threshold=None, reset_timeout=None):
+        self.threshold = threshold or Config.CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or Config.CIRCUIT_RESET_TIMEOUT
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False  # the half open probe is in flight
+        self._lock = threading.Lock()
+        self.opens = 0
+        self.rejected = 0
+
+    def before(self):
+        """raise CircuitOpenError unless a request may go out now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            wait = self._opened_at + self.reset_timeout - time.monotonic()
+            if wait <= 0 and not self._probing:
+                self.state = HALF_OPEN
+                self._probing = True  # this request is the probe
+                return
+            self.rejected += 1
+        raise CircuitOpenError(
+            f"DeepSeek looks unavailable, not sending requests for {max(wait, 1.0):.0f}s",
+            status=503,
+            retry_after=max(wait, 1.0),
+        )
+
+    @property
+    def closed(self):
+        """whether requests go out normally, for work nobody waits on yet (prefetching),
+        unlike before() this never takes the half open probe
+        """
+        return self.state == CLOSED
+
+    def record(self, error=None):
+        """outcome of a request that before() let through, error is its DeepSeekError if it failed"""
+        with self._lock:
+            self._probing = False
+            if error is None or not error.overload:
+                # the api answered, even a 4xx means it's up
+                self.state = CLOSED
+                self._failures = 0
+                return
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.threshold:
+                if self.state == CLOSED:
+                    self.opens += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """the request ended some other way (a bug, ctrl-c), it says nothing about the api"""
+        with self._lock:
+            self._probing = False
+
+class Transport:
+    """how every api request goes out: circuit breaker, retries with backoff, retry budget
+
+    callers pass a function that makes one complete attempt, fetching a fresh pow
+    first if the endpoint needs one, and raises DeepSeekError when it fails.
+    only overload failures are retried, at most max_attempts times in total
+    """
+
+    def __init__(self, budget=None, breaker=None, max_attempts=None):
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max_attempts or Config.RETRY_MAX_ATTEMPTS
+        self.retries = 0
+        self.exhausted = 0  # retries skipped because the budget was used up
+        self._lock = threading.Lock()
+
+    def _retry_delay(self, error, attempt):
+        """seconds to wait before trying again, or None to give up and raise error"""
+        if not error.overload or self.breaker.state == OPEN:
+            return None  # raise the real error, not the breaker's
+        if attempt + 1 >= self.max_attempts:
+            return None
+        if error.retry_after is not None and error.retry_after > Config.RETRY_AFTER_MAX:
+            return None  # not worth blocking on, the caller sees retry_after and can come back
+        allowed = self.budget.withdraw()
+        with self._lock:
+            if not allowed:
+                self.exhausted += 1
+                return None
+            self.retries += 1
+        return backoff_delay(attempt, error.retry_after)
+
+    def attempts(self, send):
+        """the retry loop as a generator: yields (error, delay) before every retry,
+        the caller does the waiting, and returns send()'s result. call() just sleeps,
+        a caller that reports progress can say what it's waiting for
+        """
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            self.breaker.before()
+            try:
+                result = send()
+            except CircuitOpenError:
+                self.breaker.release()  # a nested request was turned away, we learned nothing
+                raise
+            except DeepSeekError as e:
+                self.breaker.record(e)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                error = e
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record()
+                return result
+            yield error, delay
+            attempt += 1
+
+    def call(self, send):
+        """send() with retries, blocking"""
+        attempts = self.attempts(send)
+        while True:
+            try:
+                _, delay = next(attempts)
+            except StopIteration as done:
+                return done.value
+            time.sleep(delay)
+
+    async def acall(self, send):
+        """call() for coroutine functions, waits without blocking the loop"""
+        import asyncio  # the sync client uses this module too, it shouldn't load asyncio
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            self.breaker.before()
+            try:
+                result = await send()
+            except CircuitOpenError:
+                self.breaker.release()  # a nested request was turned away, we learned nothing
+                raise
+            except DeepSeekError as e:
+                self.breaker.record(e)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record()
+                return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        return {
+            "retries": self.retries,
+            "budget_exhausted": self.exhausted,
+            "budget_available": self.budget.available,
+            "circuit_state": self.breaker.state,
+            "circuit_opens": self.breaker.opens,
+            "circuit_rejected": self.breaker.rejected,
+        }
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport():
+    """shared transport for the whole process, so budget and breaker see every request"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = Transport()
+    return _transport
@@ -0,0 +1,152 @@
+import os
+import time
+import uuid
+import hashlib
+import mimetypes
+import threading
+from .config import Config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    digest TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    name TEXT,
+    size INTEGER,
+    uploaded REAL NOT NULL
+);
+"""
+
+def iter_file(path, chunk_size=None):
+    """a file's bytes in chunk_size pieces, through mmap for big files
+
+    only one chunk is ever in memory. mapped files are sliced (which copies the
+    chunk) rather than handed out as memoryviews, so the map can always be closed
+    """
+    chunk_size = chunk_size or Config.UPLOAD_CHUNK_SIZE
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size and size >= Config.UPLOAD_MMAP_THRESHOLD:
+            import mmap  # the client imports this module, plain imports stay cheap
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for start in range(0, size, chunk_size):
+                    yield mapped[start:start + chunk_size]
+            return
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+def file_digest(path):
+    """sha256 of a file's content, hashed straight from the page cache for big files"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size and size >= Config.UPLOAD_MMAP_THRESHOLD:
+            import mmap
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return hashlib.sha256(mapped).hexdigest()  # hashlib drops the gil for big buffers
+    digest = hashlib.sha256()
+    for chunk in iter_file(path):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+class MultipartFile:
+    """a multipart/form-data body with one file field, streamed from disk
+
+    the length is known up front, so it goes out with a Content-Length instead
+    of chunked transfer encoding. iterate it for requests, aiter() for httpx
+    """
+
+    def __init__(self, path, field="file", filename=None, content_type=None):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.boundary = uuid.uuid4().hex
+        filename = filename or os.path.basename(path)
+        content_type = content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        quoted = filename.replace("\\", "\\\\").replace('"', '\\"').replace("\r", " ").replace("\n", " ")
+        self._head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{quoted}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode()
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return len(self._head) + self.size + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        yield from iter_file(self.path)
+        yield self._tail
+
+    async def aiter(self):
+        for chunk in self:
+            yield chunk
+
+class UploadIndex:
+    """which files we've already uploaded, by content hash, so attaching one again is free
+
+    file ids belong to the account that uploaded them and deepseek doesn't keep
+    them forever, so entries older than ttl are ignored
+    """
+
+    def __init__(self, path=None, ttl=None):
+        self.path = path or Config.UPLOADS_DB
+        self.ttl = ttl or Config.UPLOAD_TTL
+        self.hits = 0
+        self.misses = 0
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        import sqlite3  # only when uploads are actually indexed, not on every startup
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._digests = {}  # realpath -> (size, mtime_ns, digest), so unchanged files aren't hashed twice
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def digest(self, path):
+        """content hash of a file, remembered until its size or mtime changes"""
+        real = os.path.realpath(path)
+        st = os.stat(real)
+        with self._lock:
+            known = self._digests.get(real)
+        if known is not None and known[:2] == (st.st_size, st.st_mtime_ns):
+            return known[2]
+        digest = file_digest(real)
+        with self._lock:
+            self._digests[real] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    def get(self, digest):
+        """file id for this content, or None (counted as a hit or a miss)"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT file_id FROM uploads WHERE digest = ? AND uploaded > ?",
+                (digest, time.time() - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, digest, file_id, name=None, size=None):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO uploads (digest, file_id, name, size, uploaded) VALUES (?, ?, ?, ?, ?)",
+                (digest, file_id, name, size, time.time()),
+            )
+
+    def forget(self, file_id):
+        """drop an id the api no longer knows"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM uploads WHERE file_id = ?", (file_id,))